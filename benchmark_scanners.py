@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+# Micro-benchmark of the scanners of trac2markdown on long lines, such as
+# pasted doctest output, against the former per-character loops.
+#
+# Usage: python3 benchmark_scanners.py [migrate.cfg]
+
+import random
+import timeit
+
+from rich.console import Console
+from rich.table import Table
+
+from migrate import (convert_outside_brackets, convert_outside_code,
+                     RE_CAMELCASE1, RE_CAMELCASE2, RE_LINEBREAK3, RE_WIKI1, RE_WIKI2, RE_WIKI3)
+
+def camelcase(part):
+    part = RE_CAMELCASE1.sub(r'[\1](\1)', part)
+    return RE_CAMELCASE2.sub(r'[\1](\1)', part)
+
+def linebreaks_and_wiki_links(part):
+    part = RE_LINEBREAK3.sub('\n', part)
+    part = RE_WIKI1.sub(r'[\1](\1)', part)
+    part = RE_WIKI2.sub(r'[\1](\1)', part)
+    return RE_WIKI3.sub(r'[\1](\1)', part)
+
+def loop_outside_brackets(line, convert):
+    new_line = ''
+    depth = 0
+    start = 0
+    end = 0
+    l = len(line)
+    for i in range(l + 1):
+        if i == l:
+            end = i
+        elif line[i] == '[':
+            if depth == 0:
+                end = i
+            depth += 1
+        elif line[i] == ']':
+            depth -= 1
+            if depth == 0:
+                start = i + 1
+                new_line += line[end:start]
+        if end > start:
+            new_line += convert(line[start:end])
+            start = end
+    return new_line
+
+def loop_outside_code(line, convert):
+    l = len(line)
+    new_line = ''
+    start = 0
+    inline_code = False
+    for i in range(l + 1):
+        if i == l or line[i] == '`':
+            end = i
+            part = line[start:end]
+            if not inline_code:
+                part = convert(part)
+            new_line += part
+            start = end
+            if i < l and line[i] == '`':
+                inline_code = not inline_code
+    return new_line
+
+def doctest_line(length, markup):
+    words = ['sage:', 'x', '=', '1/2*x^2', '+', '3', '...', 'Vector', 'space', 'of',
+             'dimension', '2', 'over', 'Rational', 'Field', '0.333333333333333']
+    if markup:
+        words += ['matrix(QQ,', '[[1,', '2],', '[3,', '4]])', 'VectorSpace', 'RationalField',
+                  '`x`', r'\\', '[[WikiStart]]']
+    line = []
+    while sum(len(w) + 1 for w in line) < length:
+        line.append(random.choice(words))
+    return ' '.join(line)
+
+def fuzz_line():
+    return ''.join(random.choice(['[', ']', '`', ' ', 'FooBar ', r'\\', '[[Foo]]', 'x'])
+                   for i in range(random.randint(0, 30)))
+
+if __name__ == '__main__':
+    random.seed(0)
+    for i in range(10000):
+        line = fuzz_line()
+        assert convert_outside_brackets(line, camelcase) == loop_outside_brackets(line, camelcase), line
+        assert (convert_outside_code(line, linebreaks_and_wiki_links)
+                == loop_outside_code(line, linebreaks_and_wiki_links)), line
+
+    table = Table(title='Scanners of trac2markdown')
+    table.add_column('Scanner')
+    table.add_column('Markup')
+    table.add_column('Line length', justify='right')
+    table.add_column('Loop (ms)', justify='right')
+    table.add_column('Scanner (ms)', justify='right')
+    table.add_column('Speedup', justify='right')
+    for name, scanner, loop, convert in [
+            ('brackets', convert_outside_brackets, loop_outside_brackets, camelcase),
+            ('code', convert_outside_code, loop_outside_code, linebreaks_and_wiki_links)]:
+        for markup in (False, True):
+            for length in (100, 1000, 10000, 100000):
+                line = doctest_line(length, markup)
+                number = max(1, 100000 // length)
+                assert scanner(line, convert) == loop(line, convert)
+                t_loop = timeit.timeit(lambda: loop(line, convert), number=number) / number
+                t_scanner = timeit.timeit(lambda: scanner(line, convert), number=number) / number
+                table.add_row(name, 'yes' if markup else 'no', str(len(line)),
+                              '%.3f' % (1000 * t_loop), '%.3f' % (1000 * t_scanner),
+                              '%.1fx' % (t_loop / t_scanner))
+    Console().print(table)
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+# Benchmark of the transports of XML-RPC to Trac against a local stand-in
+# server, which simulates the setup of a connection and a limited bandwidth.
+#
+# Usage: python3 benchmark_transport.py [migrate.cfg]
+
+import threading
+from time import sleep, perf_counter
+from socketserver import ThreadingMixIn
+from xmlrpc import client
+from xmlrpc.server import SimpleXMLRPCServer, SimpleXMLRPCRequestHandler
+
+from rich.console import Console
+from rich.table import Table
+
+import migrate
+from migrate import trac_server_proxy
+
+connection_setup = 0.05  # seconds, like a TCP and TLS handshake far away
+bandwidth = 2e6  # bytes per second
+
+class RequestHandler(SimpleXMLRPCRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        super().setup()
+        sleep(connection_setup)
+        self.server.connections += 1
+        write = self.wfile.write
+
+        def slow_write(data):
+            self.server.sent += len(data)
+            sleep(len(data) / bandwidth)
+            return write(data)
+
+        self.wfile.write = slow_write
+
+class Server(ThreadingMixIn, SimpleXMLRPCServer):
+    daemon_threads = True
+    connections = 0
+    sent = 0
+
+def changelog(src_ticket_id):
+    comment = 'sage: x = polygen(QQ); (x^2 + 1).factor() # the usual doctest output\n' * 10
+    return [[client.DateTime('20200101T00:00:00'), 'someone', 'comment', str(i), comment, 1]
+            for i in range(src_ticket_id % 20)]
+
+if __name__ == '__main__':
+    server = Server(('127.0.0.1', 0), RequestHandler, logRequests=False, allow_none=True)
+    server.register_function(changelog, 'ticket.changeLog')
+    server.register_multicall_functions()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = 'http://127.0.0.1:%d/' % server.server_address[1]
+    migrate.trac_rate_limiter = migrate.TokenBucket(0)
+
+    table = Table(title='Transports of XML-RPC (%d ms connection setup, %.0f MB/s)'
+                  % (1000 * connection_setup, bandwidth / 1e6))
+    table.add_column('Keep alive')
+    table.add_column('Gzip')
+    table.add_column('Requests', justify='right')
+    table.add_column('Connections', justify='right')
+    table.add_column('kB sent', justify='right')
+    table.add_column('ms per request', justify='right')
+    requests = 100
+    for keep_alive in (False, True):
+        for gzip in (False, True):
+            migrate.xmlrpc_keep_alive = keep_alive
+            migrate.xmlrpc_gzip = gzip
+            source = trac_server_proxy(url)
+            server.connections = server.sent = 0
+            start = perf_counter()
+            for src_ticket_id in range(requests):
+                source.ticket.changeLog(src_ticket_id)
+            seconds = perf_counter() - start
+            table.add_row('yes' if keep_alive else 'no', 'yes' if gzip else 'no', str(requests),
+                          str(server.connections), '%.0f' % (server.sent / 1000),
+                          '%.1f' % (1000 * seconds / requests))
+    Console().print(table)
+    server.shutdown()
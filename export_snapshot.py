@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+# Export the tickets, changelogs, attachments, milestones and wiki pages that
+# the migration requests from Trac into a snapshot, which migrate.py replays
+# with snapshot set in the source section of the configuration file, so that
+# a migration can be repeated without Trac. The calls already recorded in the
+# snapshot are not made again, so an interrupted export resumes where it
+# stopped. The results are taken from trac_cache where they are cached.
+#
+# Usage: python3 export_snapshot.py migrate.cfg SNAPSHOT_DIRECTORY
+
+import functools
+import logging
+import sys
+from xmlrpc import client
+
+import migrate
+from migrate import (TracSnapshotWriter, fetch_memoized, get_all_milestones, get_all_tickets,
+                     get_changeLog, get_milestone, get_ticket_attachment, get_ticket_ids,
+                     trac_call, trac_server_proxy)
+
+def record(snapshot, source, method, *params):
+    """
+    Return the result of the call, from the snapshot if it is recorded and
+    from Trac otherwise, or ``None`` for a fault.
+    """
+    try:
+        if (method, params) in snapshot:
+            return functools.reduce(getattr, method.split('.'), snapshot.reader)(*params)
+        result = trac_call(source, method, *params)
+    except client.Fault as e:
+        if (method, params) not in snapshot:
+            snapshot.add(method, params, fault=e)
+        return None
+    snapshot.add(method, params, result)
+    return result
+
+def record_memoized(snapshot, method, params, result):
+    """
+    Record the result of a memoized call, which is ``None`` for a fault.
+    """
+    if (method, params) in snapshot:
+        return
+    if result is None:
+        snapshot.add(method, params, fault=client.Fault(404, '%s%r not found' % (method, params)))
+    else:
+        snapshot.add(method, params, result)
+
+if __name__ == '__main__':
+    from rich.logging import RichHandler
+    logging.basicConfig(level="INFO", format="%(message)s", datefmt="[%X]", handlers=[RichHandler()])
+
+    if len(sys.argv) != 3:
+        raise SystemExit('Usage: python3 export_snapshot.py migrate.cfg SNAPSHOT_DIRECTORY')
+    migrate.trac_snapshot = None
+    source = trac_server_proxy()
+    snapshot = TracSnapshotWriter(sys.argv[2])
+
+    record_memoized(snapshot, 'ticket.query', (migrate.filter_issues,), get_ticket_ids(source, migrate.filter_issues))
+    # the blacklisted tickets are fetched by the migration in pages as well
+    tickets = list(get_all_tickets(source, migrate.filter_issues, migrate.only_issues))
+    for ticket in tickets:
+        record_memoized(snapshot, 'ticket.get', (ticket[0],), ticket)
+    for src_ticket_id in set(migrate.only_issues or ()) - {ticket[0] for ticket in tickets}:
+        record_memoized(snapshot, 'ticket.get', (src_ticket_id,), None)
+    migrate.log.info('%d tickets' % len(tickets))
+
+    chunk_size = max(migrate.multicall_size, 1)
+    attachments = 0
+    for start in range(0, len(tickets), chunk_size):
+        src_ticket_ids = [ticket[0] for ticket in tickets[start:start + chunk_size]
+                          if ('ticket.changeLog', (ticket[0],)) not in snapshot]
+        fetch_memoized(source, get_changeLog, 'ticket.changeLog', [(i,) for i in src_ticket_ids])
+        for src_ticket_id in src_ticket_ids:
+            changelog = get_changeLog(source, src_ticket_id)
+            for time, author, change_type, oldvalue, newvalue, permanent in changelog:
+                if change_type == 'attachment' and ('ticket.getAttachment', (src_ticket_id, newvalue)) not in snapshot:
+                    try:
+                        attachment = get_ticket_attachment(source, src_ticket_id, newvalue)
+                    except client.Fault as e:
+                        snapshot.add('ticket.getAttachment', (src_ticket_id, newvalue), fault=e)
+                    else:
+                        record_memoized(snapshot, 'ticket.getAttachment', (src_ticket_id, newvalue), attachment)
+                    attachments += 1
+            record_memoized(snapshot, 'ticket.changeLog', (src_ticket_id,), changelog)
+        if start // chunk_size % 50 == 0:
+            migrate.log.info('Changelogs of %d of %d tickets' % (start + len(tickets[start:start + chunk_size]),
+                                                                 len(tickets)))
+    migrate.log.info('%d attachments' % attachments)
+
+    milestone_names = get_all_milestones(source)
+    record_memoized(snapshot, 'ticket.milestone.getAll', (), milestone_names)
+    fetch_memoized(source, get_milestone, 'ticket.milestone.get', [(name,) for name in milestone_names])
+    for milestone_name in milestone_names:
+        record_memoized(snapshot, 'ticket.milestone.get', (milestone_name,), get_milestone(source, milestone_name))
+    migrate.log.info('%d milestones' % len(milestone_names))
+
+    pagenames = record(snapshot, source, 'wiki.getAllPages') or []
+    for pagename in pagenames:
+        info = record(snapshot, source, 'wiki.getPageInfo', pagename)
+        if info is not None:
+            record(snapshot, source, 'wiki.getPage', pagename, info['version'])
+        for attachment in record(snapshot, source, 'wiki.listAttachments', pagename) or []:
+            record(snapshot, source, 'wiki.getAttachment', attachment)
+    migrate.log.info('%d wiki pages' % len(pagenames))
+
+    snapshot.close()
+    migrate.output_trac_statistics(sorted(migrate.trac_statistics.items()))
@@ -0,0 +1,387 @@
+#!/usr/bin/env python3
+# Local stand-in for the XML-RPC interface of Trac, serving a synthetic corpus
+# of tickets, changelogs, attachments, milestones and wiki pages whose sizes
+# follow distributions estimated from the Sage Trac, so that the fetching and
+# the conversion of migrate.py can be measured end to end without a real Trac.
+#
+# Each ticket and wiki page is generated from the seed and its id when it is
+# requested, so the corpus takes no memory and can be scaled up at will. The
+# requests can be slowed down by a latency, and fail at random with HTTP
+# errors (retried by migrate.py) or XML-RPC faults.
+#
+# Usage: python3 fake_trac.py [--port 8000] [--scale 1] [--seed 0]
+#                             [--latency 0] [--error-rate 0] [--fault-rate 0]
+#
+# then set url: http://127.0.0.1:8000/ in the source section of migrate.cfg.
+# The number of requests by method is shown when the server is interrupted.
+
+import argparse
+import functools
+import math
+import random
+import signal
+import threading
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from socketserver import ThreadingMixIn
+from time import sleep
+from xmlrpc import client
+from xmlrpc.server import SimpleXMLRPCServer, SimpleXMLRPCRequestHandler
+
+from rich.console import Console
+from rich.table import Table
+
+# size of the Sage Trac, multiplied by --scale
+corpus_tickets = 35000
+corpus_wiki_pages = 3000
+corpus_users = 2500
+
+# fraction of the ticket ids that were deleted
+deleted_tickets = 0.01
+# lognormal distributions (median, sigma) and the largest value
+changes_per_ticket = (14, 0.9), 3000
+description_length = (600, 1.2), 200000
+comment_length = (250, 1.3), 500000
+attachment_size = (4000, 1.5), 5000000
+wiki_page_length = (2000, 1.4), 300000
+wiki_page_versions = (4, 1.0), 500
+attachments_per_wiki_page = (0.3, 1.5), 50
+
+# relative frequency of the kinds of changes in the changelogs
+change_kinds = {'comment': 45, 'cc': 15, 'status': 8, 'milestone': 6, 'branch': 5, 'commit': 5,
+                'reviewer': 3, 'attachment': 3, 'author': 2, 'summary': 2, 'description': 2,
+                'keywords': 2, 'priority': 1, 'component': 1}
+
+components = ['algebra', 'basic arithmetic', 'build', 'calculus', 'categories', 'coding theory',
+              'combinatorics', 'commutative algebra', 'cython', 'doctest coverage',
+              'documentation', 'elliptic curves', 'finite rings', 'geometry', 'graph theory',
+              'group theory', 'linear algebra', 'memleak', 'misc', 'modular forms',
+              'number fields', 'number theory', 'numerical', 'packages: optional',
+              'packages: standard', 'performance', 'plotting', 'python3', 'refactoring',
+              'symbolics', 'user interface']
+statuses = ['new', 'needs_review', 'needs_work', 'needs_info', 'positive_review', 'closed']
+priorities = ['blocker', 'critical', 'major', 'minor', 'trivial']
+types = ['defect', 'enhancement', 'task']
+keywords = ['', '', '', 'sd100', 'days42, beginner', 'padics', 'graphs', 'days75', 'cython, performance']
+words = ['sage', 'the', 'matrix', 'ring', 'field', 'polynomial', 'this', 'fix', 'patch', 'doctest',
+         'needs', 'review', 'with', 'failure', 'that', 'of', 'in', 'on', 'work', 'positive', 'a',
+         'Python', 'cython', 'is', 'should', 'be', 'branch', 'it', 'for', 'test', 'when', 'not']
+
+start_time = datetime(2006, 9, 1, tzinfo=timezone.utc)
+end_time = datetime(2023, 1, 31, tzinfo=timezone.utc)
+
+def lognormal(rng, distribution):
+    (median, sigma), largest = distribution
+    return min(int(rng.lognormvariate(math.log(median), sigma)), largest)
+
+def xmlrpc_datetime(time):
+    return client.DateTime(time.utctimetuple())
+
+def user(rng):
+    return 'user%d' % rng.randrange(corpus_users)
+
+def paragraph(rng, length, n_tickets):
+    """
+    Return Trac wiki markup of about ``length`` characters.
+    """
+    parts = []
+    size = 0
+    while size < length:
+        kind = rng.random()
+        if kind < 0.6:
+            part = ' '.join(rng.choice(words) for i in range(rng.randint(5, 30))) + '.'
+        elif kind < 0.7:
+            part = 'See #%d and [comment:%d] of ticket:%d.' % (
+                rng.randint(1, n_tickets), rng.randint(1, 30), rng.randint(1, n_tickets))
+        elif kind < 0.8:
+            part = '{{{\nsage: x = polygen(QQ)\nsage: (x^2 - 1).factor()\n(x - 1) * (x + 1)\n' \
+                   + 'sage: M = matrix(QQ, [[1, 2], [3, 4]])\n' * rng.randint(0, 20) + '}}}'
+        elif kind < 0.85:
+            part = '== %s ==\n\n * %s\n * %s' % tuple(
+                ' '.join(rng.choice(words) for i in range(4)) for j in range(3))
+        elif kind < 0.9:
+            part = '||= %s =||= %s =||\n|| %s || %s ||' % tuple(rng.choice(words) for i in range(4))
+        elif kind < 0.95:
+            part = "'''%s''' ''%s'' `%s` [[WikiStart]] SageDays [https://www.sagemath.org/ Sage]" % tuple(
+                rng.choice(words) for i in range(3))
+        else:
+            # pasted output, as a long line
+            part = ' '.join(rng.choice(words) for i in range(rng.randint(100, 2000)))
+        parts.append(part)
+        size += len(part) + 2
+    return '\n\n'.join(parts)
+
+def attachment_names(src_ticket_id, count):
+    return ['trac_%d%s.patch' % (src_ticket_id, '' if i == 0 else '-%d' % i) if i % 4 != 3
+            else ('plot%d.png' % i if i % 8 == 3 else 'log%d.txt' % i) for i in range(count)]
+
+class Corpus:
+    """
+    Synthetic corpus of ``scale`` times the size of the Sage Trac.
+    """
+    def __init__(self, scale, seed):
+        self.seed = seed
+        self.n_tickets = max(1, int(corpus_tickets * scale))
+        self.n_wiki_pages = max(1, int(corpus_wiki_pages * scale))
+        rng = random.Random(seed)
+        self.ticket_ids = [i for i in range(1, self.n_tickets + 1) if rng.random() >= deleted_tickets]
+        self.milestones = ['sage-%d.%d' % (major, minor) for major in range(1, 10)
+                           for minor in range(max(1, int(45 * scale)))] \
+                          + ['sage-duplicate/invalid/wontfix', 'sage-pending', 'sage-wishlist']
+        self.pagenames = ['WikiStart'] + ['%s%d' % (rng.choice(['SageDays', 'Devel', 'Tutorial', 'days/sd']), i)
+                                          for i in range(1, self.n_wiki_pages)]
+
+    def _time(self, fraction):
+        return start_time + (end_time - start_time) * fraction
+
+    @functools.lru_cache(maxsize=4096)
+    def ticket(self, src_ticket_id):
+        """
+        Return the ticket as ``ticket.get`` does, and its changelog.
+        """
+        rng = random.Random('%s ticket %d' % (self.seed, src_ticket_id))
+        time = self._time(src_ticket_id / (self.n_tickets + 1))
+        values = {'summary': ' '.join(rng.choice(words) for i in range(rng.randint(3, 12))).capitalize(),
+                  'description': paragraph(rng, lognormal(rng, description_length), self.n_tickets),
+                  'reporter': user(rng), 'owner': rng.choice(['', user(rng)]),
+                  'status': 'new', 'type': rng.choice(types), 'component': rng.choice(components),
+                  'milestone': rng.choice(self.milestones), 'priority': rng.choice(priorities),
+                  'severity': '', 'keywords': rng.choice(keywords), 'cc': '', 'resolution': '',
+                  'version': '', 'branch': '', 'commit': '', 'author': '', 'reviewer': '',
+                  'dependencies': rng.choice(['', '#%d' % rng.randint(1, self.n_tickets)]),
+                  'upstream': '', 'merged': '', 'work_issues': '', 'stopgaps': ''}
+        changelog = []
+        comments = 0
+        attachments = 0
+        kinds = list(change_kinds)
+        weights = list(change_kinds.values())
+        change_time = time
+        for i in range(lognormal(rng, changes_per_ticket)):
+            change_time += timedelta(seconds=int(rng.expovariate(1 / 86400)) + 1)
+            kind = rng.choices(kinds, weights)[0]
+            author = user(rng)
+            if kind == 'comment':
+                comments += 1
+                changelog.append([change_time, author, 'comment', str(comments),
+                                  paragraph(rng, lognormal(rng, comment_length), self.n_tickets), 1])
+                continue
+            if kind == 'attachment':
+                filename = attachment_names(src_ticket_id, attachments + 1)[-1]
+                attachments += 1
+                changelog.append([change_time, author, 'attachment', '', filename, 0])
+                changelog.append([change_time, author, 'comment', '', '', 0])
+                continue
+            if kind == 'cc':
+                new = ', '.join(filter(None, [values['cc'], author]))
+            elif kind == 'status':
+                new = rng.choice([s for s in statuses if s != values['status']])
+                if new == 'closed':
+                    changelog.append([change_time, author, 'resolution', '', 'fixed', 1])
+                    values['resolution'] = 'fixed'
+            elif kind == 'milestone':
+                new = rng.choice(self.milestones)
+            elif kind == 'branch':
+                new = 'u/%s/ticket/%d' % (author, src_ticket_id)
+            elif kind == 'commit':
+                new = ''.join(rng.choice('0123456789abcdef') for j in range(40))
+            elif kind in ('reviewer', 'author'):
+                new = author
+            elif kind == 'summary':
+                new = values['summary'] + ' ' + rng.choice(words)
+            elif kind == 'description':
+                new = values['description'] + '\n\n' + paragraph(rng, 200, self.n_tickets)
+            elif kind == 'keywords':
+                new = rng.choice(keywords)
+            elif kind == 'priority':
+                new = rng.choice(priorities)
+            else:
+                new = rng.choice(components)
+            comments += 1
+            changelog.append([change_time, author, 'comment', str(comments), '', 1])
+            changelog.append([change_time, author, kind, values[kind], new, 1])
+            values[kind] = new
+        values['time'] = xmlrpc_datetime(time)
+        values['changetime'] = xmlrpc_datetime(change_time)
+        values['_ts'] = str(int(change_time.timestamp() * 1e6))
+        changelog = [[xmlrpc_datetime(t), *change] for t, *change in changelog]
+        return [src_ticket_id, values['time'], values['changetime'], values], changelog
+
+    def attachment(self, parent, filename):
+        rng = random.Random('%s attachment %s %s' % (self.seed, parent, filename))
+        size = lognormal(rng, attachment_size)
+        if filename.endswith('.png'):
+            return rng.randbytes(size)
+        line = 'diff --git a/src/sage/rings/integer.pyx b/src/sage/rings/integer.pyx\n+    return x\n'
+        return (line * (size // len(line) + 1))[:size].encode()
+
+    @functools.lru_cache(maxsize=1024)
+    def wiki_page(self, pagename):
+        """
+        Return the versions of the wiki page as ``wiki.getPageInfo`` does, its
+        text and its attachments.
+        """
+        rng = random.Random('%s wiki %s' % (self.seed, pagename))
+        versions = max(1, lognormal(rng, wiki_page_versions))
+        time = self._time(rng.random())
+        author = rng.choice(['trac'] + [user(rng)] * 20)
+        info = {'name': pagename, 'lastModified': xmlrpc_datetime(time),
+                'author': author, 'version': versions, 'comment': ''}
+        text = paragraph(rng, lognormal(rng, wiki_page_length), self.n_tickets)
+        attachments = ['%s/file%d%s' % (pagename, i, rng.choice(['.png', '.txt', '.pdf']))
+                       for i in range(lognormal(rng, attachments_per_wiki_page))]
+        return info, text, attachments
+
+class Trac:
+    """
+    XML-RPC methods of Trac on the corpus.
+    """
+    def __init__(self, corpus):
+        self.corpus = corpus
+
+    def _ticket(self, src_ticket_id):
+        if src_ticket_id not in self._ticket_ids:
+            raise client.Fault(404, 'Ticket %s does not exist.' % src_ticket_id)
+        return self.corpus.ticket(src_ticket_id)
+
+    @functools.cached_property
+    def _ticket_ids(self):
+        return set(self.corpus.ticket_ids)
+
+    def query(self, qstr='status!=closed'):
+        # only the ordering by id and the number of tickets are supported
+        ids = self.corpus.ticket_ids
+        for term in qstr.split('&'):
+            field, _, value = term.partition('=')
+            if field == 'max' and int(value) > 0:
+                ids = ids[:int(value)]
+        return ids
+
+    def get(self, src_ticket_id):
+        return self._ticket(src_ticket_id)[0]
+
+    def changeLog(self, src_ticket_id, when=0):
+        return self._ticket(src_ticket_id)[1]
+
+    def getAttachment(self, src_ticket_id, filename):
+        changelog = self._ticket(src_ticket_id)[1]
+        if not any(change[2] == 'attachment' and change[4] == filename for change in changelog):
+            raise client.Fault(404, 'Attachment %s of ticket %s not found' % (filename, src_ticket_id))
+        return client.Binary(self.corpus.attachment(src_ticket_id, filename))
+
+    def getRecentChanges(self, since):
+        # the corpus does not change
+        return []
+
+    def milestone_getAll(self):
+        return self.corpus.milestones
+
+    def milestone_get(self, name):
+        if name not in self.corpus.milestones:
+            raise client.Fault(404, 'Milestone %s does not exist.' % name)
+        return {'name': name, 'description': 'Release %s' % name, 'due': 0, 'completed': 0}
+
+    def wiki_getAllPages(self):
+        return self.corpus.pagenames
+
+    def _wiki_page(self, pagename):
+        if pagename not in self.corpus.pagenames:
+            raise client.Fault(404, 'Wiki page "%s" does not exist' % pagename)
+        return self.corpus.wiki_page(pagename)
+
+    def wiki_getPageInfo(self, pagename, version=None):
+        return self._wiki_page(pagename)[0]
+
+    def wiki_getPage(self, pagename, version=None):
+        return self._wiki_page(pagename)[1]
+
+    def wiki_listAttachments(self, pagename):
+        return self._wiki_page(pagename)[2]
+
+    def wiki_getAttachment(self, path):
+        pagename, _, filename = path.rpartition('/')
+        if path not in self._wiki_page(pagename)[2]:
+            raise client.Fault(404, 'Attachment %s not found' % path)
+        return client.Binary(self.corpus.attachment(pagename, filename))
+
+    def wiki_getRecentChanges(self, since):
+        return []
+
+class RequestHandler(SimpleXMLRPCRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        server = self.server
+        if server.latency:
+            sleep(server.rng.expovariate(1 / server.latency))
+        if server.rng.random() < server.error_rate:
+            with server.lock:
+                server.statistics['HTTP 503'] += 1
+            # the request is read so that the connection can be kept alive
+            self.rfile.read(int(self.headers.get('content-length', 0)))
+            self.send_response(503)
+            self.send_header('Content-length', '0')
+            self.end_headers()
+            return
+        super().do_POST()
+
+class Server(ThreadingMixIn, SimpleXMLRPCServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency, error_rate, fault_rate):
+        super().__init__(address, RequestHandler, logRequests=False, allow_none=True)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.fault_rate = fault_rate
+        self.rng = random.Random()
+        self.lock = threading.Lock()
+        self.statistics = Counter()
+
+    def _dispatch(self, method, params):
+        with self.lock:
+            self.statistics[method] += 1
+        if method != 'system.multicall' and self.rng.random() < self.fault_rate:
+            with self.lock:
+                self.statistics['injected fault'] += 1
+            raise client.Fault(500, 'Injected fault')
+        return super()._dispatch(method, params)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Local stand-in for the XML-RPC interface of Trac')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--scale', type=float, default=1.0,
+                        help='size of the corpus relative to the Sage Trac (%d tickets)' % corpus_tickets)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='mean delay in seconds before answering a request')
+    parser.add_argument('--error-rate', type=float, default=0.0,
+                        help='fraction of the requests answered with HTTP 503')
+    parser.add_argument('--fault-rate', type=float, default=0.0,
+                        help='fraction of the calls answered with an XML-RPC fault')
+    args = parser.parse_args()
+
+    trac = Trac(Corpus(args.scale, args.seed))
+    server = Server(('127.0.0.1', args.port), args.latency, args.error_rate, args.fault_rate)
+    for name in ['query', 'get', 'changeLog', 'getAttachment', 'getRecentChanges']:
+        server.register_function(getattr(trac, name), 'ticket.' + name)
+    for name in ['getAll', 'get']:
+        server.register_function(getattr(trac, 'milestone_' + name), 'ticket.milestone.' + name)
+    for name in ['getAllPages', 'getPageInfo', 'getPage', 'listAttachments', 'getAttachment',
+                 'getRecentChanges']:
+        server.register_function(getattr(trac, 'wiki_' + name), 'wiki.' + name)
+    server.register_multicall_functions()
+    server.register_introspection_functions()
+    print('Serving %d tickets and %d wiki pages at http://127.0.0.1:%d/'
+          % (len(trac.corpus.ticket_ids), len(trac.corpus.pagenames), args.port))
+    # shows the statistics when terminated as well
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+    table = Table(title='Requests to the fake Trac')
+    table.add_column('Method', justify='right', style='cyan', no_wrap=True)
+    table.add_column('Calls', style='magenta')
+    for method, calls in sorted(server.statistics.items()):
+        table.add_row(method, '%d' % calls)
+    Console().print(table)
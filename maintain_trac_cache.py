@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+# Maintain trac_cache: report its entries and their sizes by the memoized
+# function, compact it by storing its values again with the compression of the
+# configuration file and reclaiming the free space of its databases, or export
+# it to a file and import such a file, for instance into the cache of another
+# machine.
+#
+# Usage: python3 maintain_trac_cache.py migrate.cfg report
+#        python3 maintain_trac_cache.py migrate.cfg compact
+#        python3 maintain_trac_cache.py migrate.cfg export FILE
+#        python3 maintain_trac_cache.py migrate.cfg import FILE
+
+import gzip
+import logging
+import os
+import pickle
+import sqlite3
+import sys
+from collections import defaultdict
+
+from diskcache import FanoutCache
+from rich.console import Console
+from rich.table import Table
+
+import migrate
+from migrate import cache, compressed_value_magic
+
+export_format = {'format': 'trac_cache', 'version': 1}
+
+def cache_databases():
+    """
+    Return the sqlite databases of trac_cache, one for each shard.
+    """
+    if isinstance(cache, FanoutCache):
+        return [os.path.join(shard.directory, 'cache.db') for shard in cache._shards]
+    return [os.path.join(cache.directory, 'cache.db')]
+
+def entry_name(key, raw):
+    """
+    Return the name of the memoized function of the key of an entry, or the
+    key itself for the other entries.
+    """
+    if not raw:
+        key = pickle.loads(key)
+    if isinstance(key, tuple) and key:
+        key = key[0]
+    return str(key).replace('__main__.', '')
+
+def is_compressed(database, filename, value):
+    if filename:
+        with open(os.path.join(os.path.dirname(database), filename), 'rb') as f:
+            value = f.read(len(compressed_value_magic) + 1)
+    return (isinstance(value, bytes) and value.startswith(compressed_value_magic)
+            and value[len(compressed_value_magic):len(compressed_value_magic) + 1] != b'n')
+
+def report():
+    entries = defaultdict(lambda: defaultdict(int))
+    database_size = 0
+    for database in cache_databases():
+        database_size += os.path.getsize(database)
+        connection = sqlite3.connect(database)
+        for key, raw, size, filename, value in connection.execute(
+                'SELECT key, raw, size + coalesce(length(value), 0), filename, substr(value, 1, 4) FROM Cache'):
+            statistics = entries[entry_name(key, raw)]
+            statistics['entries'] += 1
+            statistics['bytes'] += size
+            statistics['compressed'] += is_compressed(database, filename, value)
+        connection.close()
+
+    table = Table(title="Entries of trac_cache (%d databases, %.1f MB)"
+                  % (len(cache_databases()), database_size / 1e6))
+    table.add_column("Function", justify="right", style="cyan", no_wrap=True)
+    table.add_column("Entries", style="magenta")
+    table.add_column("Compressed", style="magenta")
+    table.add_column("Size (MB)", justify="right", style="magenta")
+    for name, statistics in sorted(entries.items()):
+        table.add_row(name, '%d' % statistics['entries'], '%d' % statistics['compressed'],
+                      '%.2f' % (statistics['bytes'] / 1e6))
+    Console().print(table)
+
+def compact():
+    missing = object()
+    keys = list(cache)
+    for key in keys:
+        value = cache.get(key, default=missing, retry=True)
+        if value is not missing:
+            cache.set(key, value, retry=True)
+    migrate.log.info('Stored %d entries again with compression %s'
+                     % (len(keys), migrate.cache_compression))
+    for warning in cache.check(fix=True):
+        migrate.log.warning(warning.message)
+    for database in cache_databases():
+        size = os.path.getsize(database)
+        connection = sqlite3.connect(database, isolation_level=None)
+        connection.execute('VACUUM')
+        connection.close()
+        migrate.log.info('Vacuumed %s from %.1f to %.1f MB'
+                         % (database, size / 1e6, os.path.getsize(database) / 1e6))
+
+def export_cache(filename):
+    missing = object()
+    entries = 0
+    with gzip.open(filename, 'wb') as f:
+        pickle.dump(export_format, f)
+        for key in cache:
+            value = cache.get(key, default=missing, retry=True)
+            if value is not missing:
+                pickle.dump((key, value), f)
+                entries += 1
+    migrate.log.info('Exported %d entries to %s' % (entries, filename))
+
+def import_cache(filename):
+    entries = 0
+    with gzip.open(filename, 'rb') as f:
+        if pickle.load(f) != export_format:
+            raise SystemExit('%s is not an export of trac_cache' % filename)
+        # the imported entries are synced since their own watermark, if any
+        cache.delete('sync_watermark')
+        while True:
+            try:
+                key, value = pickle.load(f)
+            except EOFError:
+                break
+            cache.set(key, value, retry=True)
+            entries += 1
+    migrate.log.info('Imported %d entries from %s' % (entries, filename))
+
+if __name__ == '__main__':
+    from rich.logging import RichHandler
+    logging.basicConfig(level="INFO", format="%(message)s", datefmt="[%X]", handlers=[RichHandler()])
+
+    if len(sys.argv) == 3 and sys.argv[2] == 'report':
+        report()
+    elif len(sys.argv) == 3 and sys.argv[2] == 'compact':
+        compact()
+        report()
+    elif len(sys.argv) == 4 and sys.argv[2] == 'export':
+        export_cache(sys.argv[3])
+    elif len(sys.argv) == 4 and sys.argv[2] == 'import':
+        import_cache(sys.argv[3])
+    else:
+        raise SystemExit('Usage: python3 maintain_trac_cache.py migrate.cfg report|compact|export FILE|import FILE')
@@ -40,13 +40,30 @@ import codecs
 import logging
 import mimetypes
 import types
+import unicodedata
+import zlib
+import glob
 import gzip
+import html
+import inspect
 import json
-from collections import defaultdict
+import pickle
+import shutil
+import functools
+import heapq
+import random
+import signal
+import multiprocessing
+import threading
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from copy import copy
-from datetime import datetime
+from itertools import islice
+from datetime import datetime, timedelta, timezone
 from difflib import unified_diff
-from time import sleep
+from hashlib import sha1, sha256
+from time import sleep, perf_counter, monotonic
+from urllib.parse import parse_qs, quote, unquote, urlsplit
 from roman import toRoman
 from xmlrpc import client
 from github import Github, GithubObject, InputFileContent
@@ -58,9 +75,6 @@ from enum import Enum
 
 from migration_archive_writer import MigrationArchiveWritingRequester
 
-import markdown
-from markdown.extensions.tables import TableExtension
-
 from rich.console import Console
 from rich.table import Table
 
@@ -102,6 +116,19 @@ trac_path = None
 if config.has_option('source', 'path') :
     trac_path = config.get('source', 'path')
 
+trac_env = None
+if config.has_option('source', 'env'):
+    # set this path in the source section of the configuration file to read
+    # the database and the attachments of a copy of the environment of Trac
+    # instead of requesting them from url
+    trac_env = config.get('source', 'env')
+trac_snapshot = None
+if config.has_option('source', 'snapshot'):
+    # set this path in the source section of the configuration file to
+    # replay the snapshot written by export_snapshot.py instead of
+    # requesting Trac
+    trac_snapshot = config.get('source', 'snapshot')
+
 keep_trac_ticket_references = config.getboolean('source', 'keep_trac_ticket_references')
 
 class subdir(Enum):
@@ -197,6 +224,20 @@ if config.has_option('issues', 'blacklist_issues'):
 filter_issues = 'max=0&order=id'
 if config.has_option('issues', 'filter_issues') :
     filter_issues = config.get('issues', 'filter_issues')
+ticket_page_size = 500
+if config.has_option('issues', 'ticket_page_size'):
+    ticket_page_size = config.getint('issues', 'ticket_page_size')
+prefetch_tickets = 0
+if config.has_option('issues', 'prefetch_tickets'):
+    prefetch_tickets = config.getint('issues', 'prefetch_tickets')
+prefetch_threads = 4
+if config.has_option('issues', 'prefetch_threads'):
+    prefetch_threads = config.getint('issues', 'prefetch_threads')
+conversion_processes = 0
+if config.has_option('issues', 'conversion_processes'):
+    conversion_processes = config.getint('issues', 'conversion_processes')
+# number of upcoming tickets whose texts are submitted to the conversion pool
+conversion_lookahead = 4 * conversion_processes
 try:
     keywords_to_labels = config.getboolean('issues', 'keywords_to_labels')
 except ValueError:
@@ -258,11 +299,19 @@ if attachment_export:
         if not attachment_export_url.endswith('/') :
             attachment_export_url += '/'
         attachment_export_url += 'files/'
+attachment_mirror_dir = None
+if config.has_option('attachments', 'mirror_dir'):
+    # set this path in the attachments section of the configuration file to
+    # take the attachments from the mirror written by mirror_attachments.py
+    attachment_mirror_dir = config.get('attachments', 'mirror_dir')
 
 must_convert_wiki = config.getboolean('wiki', 'migrate')
 wiki_export_dir = None
 if must_convert_wiki or config.has_option('wiki', 'export_dir'):
     wiki_export_dir = config.get('wiki', 'export_dir')
+# the pages last modified by these authors, such as the pages created with the
+# environment of Trac, are not migrated
+wiki_exclude_authors = ['trac']
 
 default_multilines = False
 if config.has_option('source', 'default_multilines') :
@@ -271,8 +320,230 @@ if config.has_option('source', 'default_multilines') :
     # trac2markdown
     default_multilines = config.getboolean('source', 'default_multilines')
 
-from diskcache import Cache
-cache = Cache('trac_cache', size_limit=int(20e9))
+conversion_time_limit = 0
+if config.has_option('source', 'conversion_time_limit'):
+    # set this number of seconds in the source section of the configuration
+    # file to render a text literally if its conversion takes longer
+    conversion_time_limit = config.getfloat('source', 'conversion_time_limit')
+
+slowest_conversions = 0
+if config.has_option('source', 'slowest_conversions'):
+    # set this number in the source section of the configuration file to
+    # report the slowest conversions with the rule that took the most time
+    slowest_conversions = config.getint('source', 'slowest_conversions')
+
+use_python_markdown = False
+if config.has_option('source', 'python_markdown_tables'):
+    # set this boolean to yes in the source section of the configuration file
+    # to render the tables with td blocks by python-markdown instead of
+    # markdown_table_html
+    use_python_markdown = config.getboolean('source', 'python_markdown_tables')
+if use_python_markdown:
+    import markdown
+    from markdown.extensions.tables import TableExtension
+
+requests_per_second = 1 / sleep_before_xmlrpc
+if config.has_option('source', 'requests_per_second'):
+    # set this number in the source section of the configuration file to
+    # change the rate of the requests to Trac (0 for no limit)
+    requests_per_second = config.getfloat('source', 'requests_per_second')
+requests_burst = 1
+if config.has_option('source', 'requests_burst'):
+    requests_burst = config.getint('source', 'requests_burst')
+xmlrpc_keep_alive = True
+if config.has_option('source', 'keep_alive'):
+    # set this boolean to no in the source section of the configuration file
+    # to close the connection to Trac after each request
+    xmlrpc_keep_alive = config.getboolean('source', 'keep_alive')
+xmlrpc_gzip = True
+if config.has_option('source', 'gzip'):
+    # set this boolean to no in the source section of the configuration file
+    # to refuse compressed responses of Trac
+    xmlrpc_gzip = config.getboolean('source', 'gzip')
+xmlrpc_timeout = 300.0
+if config.has_option('source', 'timeout'):
+    # set this number in the source section of the configuration file to
+    # change the time in seconds of connecting to Trac and of waiting for
+    # each block of a response (0 for no limit)
+    xmlrpc_timeout = config.getfloat('source', 'timeout') or None
+retry_attempts = 8
+if config.has_option('source', 'retry_attempts'):
+    # set these numbers in the source section of the configuration file to
+    # change how often a request to Trac is retried after a transport error,
+    # for each request and in total per hour, and the first delay in
+    # seconds, which doubles after each attempt up to
+    # sleep_before_xmlrpc_retry
+    retry_attempts = config.getint('source', 'retry_attempts')
+retry_budget = 200
+if config.has_option('source', 'retry_budget'):
+    retry_budget = config.getint('source', 'retry_budget')
+retry_delay = 1.0
+if config.has_option('source', 'retry_delay'):
+    retry_delay = config.getfloat('source', 'retry_delay')
+multicall_size = 20
+if config.has_option('source', 'multicall_size'):
+    # set this number in the source section of the configuration file to
+    # change the number of changelogs or milestones fetched in one request
+    multicall_size = config.getint('source', 'multicall_size')
+sync_overlap = 3600
+if config.has_option('source', 'sync_overlap'):
+    # seconds before the last sync whose changes are synced again, which
+    # covers a difference between the clocks of Trac and of this machine
+    sync_overlap = config.getint('source', 'sync_overlap')
+
+cache_shards = 1
+if config.has_option('source', 'cache_shards'):
+    # set this number in the source section of the configuration file to
+    # shard trac_cache into several databases, which are locked separately
+    cache_shards = config.getint('source', 'cache_shards')
+cache_timeout = 60
+if config.has_option('source', 'cache_timeout'):
+    # seconds to wait for the lock of a database of trac_cache
+    cache_timeout = config.getfloat('source', 'cache_timeout')
+cache_compression = 'zlib'
+if config.has_option('source', 'cache_compression'):
+    # set this to zstd (which needs zstandard installed) or none in the source
+    # section of the configuration file to change the compression of the
+    # values of trac_cache; values stored otherwise are read as well
+    cache_compression = config.get('source', 'cache_compression')
+if cache_compression == 'zstd':
+    import zstandard
+cache_compress_threshold = 1024
+if config.has_option('source', 'cache_compress_threshold'):
+    # values whose pickle is smaller than this number of bytes are not compressed
+    cache_compress_threshold = config.getint('source', 'cache_compress_threshold')
+
+from diskcache import Cache, Disk, FanoutCache
+from diskcache.core import UNKNOWN
+
+# prefix of the values encoded by CompressedDisk, followed by the codec
+compressed_value_magic = b'\x00tc'
+
+class CompressedDisk(Disk):
+    """
+    Disk of diskcache storing the pickles of the values of at least
+    ``cache_compress_threshold`` bytes compressed by ``cache_compression``,
+    as bytes starting with ``compressed_value_magic``. Bytes values are
+    always encoded, so that they cannot be mistaken for encoded values.
+
+    The configuration is not passed as settings of the cache, which would be
+    stored in it and passed to the disk of any program opening it.
+    """
+    def __init__(self, directory, **kwargs):
+        super().__init__(directory, **kwargs)
+        self.compression = cache_compression
+        self.compress_threshold = cache_compress_threshold
+        if self.compression not in ('zstd', 'zlib', 'none'):
+            raise ValueError('Unknown compression of trac_cache: %s' % self.compression)
+
+    def store(self, value, read, key=UNKNOWN):
+        if not read and type(value) not in (int, float):
+            data = pickle.dumps(value, protocol=self.pickle_protocol)
+            if type(value) is bytes or (self.compression != 'none' and len(data) >= self.compress_threshold):
+                if self.compression == 'none' or len(data) < self.compress_threshold:
+                    value = compressed_value_magic + b'n' + data
+                elif self.compression == 'zstd':
+                    value = compressed_value_magic + b's' + zstandard.ZstdCompressor().compress(data)
+                else:
+                    value = compressed_value_magic + b'z' + zlib.compress(data)
+        return super().store(value, read, key=key)
+
+    def fetch(self, mode, filename, value, read):
+        value = super().fetch(mode, filename, value, read)
+        if type(value) is bytes and value.startswith(compressed_value_magic):
+            codec = value[len(compressed_value_magic):len(compressed_value_magic) + 1]
+            data = value[len(compressed_value_magic) + 1:]
+            if codec == b's':
+                import zstandard
+                data = zstandard.ZstdDecompressor().decompress(data)
+            elif codec == b'z':
+                data = zlib.decompress(data)
+            value = pickle.loads(data)
+        return value
+
+# counters of the operations on trac_cache: calls, hits, misses, seconds,
+# max_seconds
+cache_statistics = defaultdict(lambda: defaultdict(float))
+cache_statistics_lock = threading.Lock()
+cache_miss = object()
+
+def count_cache_operation(operation, seconds, hit):
+    with cache_statistics_lock:
+        statistics = cache_statistics[operation]
+        statistics['calls'] += 1
+        statistics['hits' if hit else 'misses'] += 1
+        statistics['seconds'] += seconds
+        statistics['max_seconds'] = max(statistics['max_seconds'], seconds)
+
+class CacheStatisticsMixin:
+    """
+    Mixin of the caches of diskcache counting the hits of the lookups and
+    the timings of the lookups and stores in ``cache_statistics``. A store
+    counts as a miss if it timed out.
+    """
+    def get(self, key, default=None, *args, **kwargs):
+        start = perf_counter()
+        value = super().get(key, cache_miss, *args, **kwargs)
+        count_cache_operation('get', perf_counter() - start, value is not cache_miss)
+        return default if value is cache_miss else value
+
+    def __contains__(self, key):
+        start = perf_counter()
+        result = super().__contains__(key)
+        count_cache_operation('contains', perf_counter() - start, result)
+        return result
+
+    def set(self, *args, **kwargs):
+        start = perf_counter()
+        result = super().set(*args, **kwargs)
+        count_cache_operation('set', perf_counter() - start, result)
+        return result
+
+class TracCache(CacheStatisticsMixin, Cache):
+    pass
+
+class TracFanoutCache(CacheStatisticsMixin, FanoutCache):
+    pass
+
+# the sharded caches are in their own directories next to trac_cache, by
+# number of shards, so that changing the number of shards starts with an
+# empty cache (diskcache removes the files of another cache in its directory)
+cache_directory = 'trac_cache'
+if cache_shards > 1:
+    cache_directory = 'trac_cache_%d_shards' % cache_shards
+
+def unused_cache_directories():
+    """
+    Return the directories of the caches of the other numbers of shards.
+    """
+    directories = sorted(glob.glob('trac_cache_*_shards'))
+    if os.path.exists(os.path.join('trac_cache', 'cache.db')):
+        directories.insert(0, 'trac_cache')
+    return [directory for directory in directories if directory != cache_directory]
+
+if cache_shards > 1:
+    cache = TracFanoutCache(cache_directory, shards=cache_shards, timeout=cache_timeout, size_limit=int(20e9),
+                            disk=CompressedDisk)
+else:
+    cache = TracCache(cache_directory, timeout=cache_timeout, size_limit=int(20e9), disk=CompressedDisk)
+if not len(cache):
+    # nothing in the new cache was fetched before now, so this is the
+    # watermark of sync_trac_cache
+    cache.add('sync_watermark', datetime.now(timezone.utc) - timedelta(seconds=sync_overlap))
+if unused_cache_directories():
+    log.warning('The caches %s of other numbers of shards are not updated by sync_trac_cache.py '
+                'and may be stale; remove them'
+                % ', '.join(unused_cache_directories()))
+
+def memoize(ignore=()):
+    """
+    Decorator memoizing the function in ``cache`` under the name that it has
+    when migrate.py is run, so that the scripts importing this module find
+    the same entries.
+    """
+    def decorator(function):
+        return cache.memoize(name='__main__.' + function.__name__, ignore=ignore)(function)
+    return decorator
 
 gh_labels = dict()
 gh_user = None
@@ -310,6 +581,138 @@ if os.path.exists('wiki_path_conversion_table.txt'):
 elif must_convert_wiki:
     create_wiki_link_conversion_table = True
 
+use_conversion_cache = True
+if config.has_option('source', 'conversion_cache'):
+    # set this boolean to no in the source section of the configuration file
+    # to convert every text again instead of taking it from the conversion
+    # cache (see cached_conversion)
+    use_conversion_cache = config.getboolean('source', 'conversion_cache')
+
+# The options of the configuration file read by the conversion. The
+# usernames are not among them, since the conversions taken from the cache
+# are converted again if their usernames are mapped differently now (see
+# replay_conversion_effects).
+conversion_options = [
+    ('source', 'url'),
+    ('source', 'cgit_url'),
+    ('source', 'path'),
+    ('source', 'keep_trac_ticket_references'),
+    ('source', 'default_multilines'),
+    ('source', 'python_markdown_tables'),
+    ('attachments', 'export'),
+    ('attachments', 'export_url'),
+    ('wiki', 'url'),
+    ('target', 'issues_repo_url'),
+    ('target', 'git_repo_url'),
+    ('target', 'migration_archive'),
+]
+
+# the functions and classes from which the code of the conversion is found
+# (see conversion_fingerprint)
+conversion_roots = ['trac2markdown', 'cached_conversion', 'guarded_conversion', 'IssuesConversionHelper']
+
+def code_global_names(code):
+    """
+    Return the names used by the code object and by the code nested in it.
+    """
+    names = set(code.co_names)
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            names |= code_global_names(const)
+    return names
+
+def conversion_constant(value):
+    """
+    Return a representation of a constant value used by the conversion, or
+    ``None`` if the value may change while migrating.
+    """
+    if isinstance(value, re.Pattern):
+        return repr((value.pattern, value.flags))
+    if value is None or isinstance(value, (str, bytes, int, float)):
+        return repr(value)
+    if isinstance(value, (tuple, list, set, frozenset)):
+        items = [conversion_constant(item) for item in value]
+        if None in items:
+            return None
+        if isinstance(value, (set, frozenset)):
+            items.sort()
+        return '(%s)' % ', '.join(items)
+    if type(value).__module__ == __name__ and hasattr(value, '__dict__'):
+        return conversion_constant(tuple(sorted(vars(value).items())))
+    return None
+
+def conversion_fingerprint():
+    """
+    Return a fingerprint of the converter code and of the configuration
+    values the conversion depends on.
+
+    The code is the source of the functions and classes of this module that
+    are reached from ``conversion_roots`` by the global names in their code,
+    with the regular expressions and other constants among these names. The
+    functions memoized in the trac cache only fetch data and are not
+    followed.
+    """
+    parts = {}
+    names = list(conversion_roots)
+    while names:
+        name = names.pop()
+        if name in parts or name not in globals() or name.startswith('__'):
+            continue
+        value = globals()[name]
+        if isinstance(value, (types.FunctionType, type)) and value.__module__ == __name__:
+            if hasattr(value, '__cache_key__'):
+                continue
+            value = inspect.unwrap(value)
+            if isinstance(value, type):
+                # a class is given by its methods and the constants of its body
+                names.extend(base.__name__ for base in value.__bases__)
+                members = sorted(vars(value).items())
+            else:
+                members = [(name, value)]
+            source = []
+            for member, item in members:
+                function = getattr(item, '__func__', getattr(item, 'fget', item))
+                if isinstance(function, types.FunctionType):
+                    source.append(inspect.getsource(function))
+                    names.extend(code_global_names(function.__code__))
+                elif not member.startswith('__'):
+                    source.append(repr((member, conversion_constant(item))))
+            parts[name] = ''.join(source)
+        elif value is not None:
+            if type(value).__module__ == __name__:
+                names.append(type(value).__name__)
+            constant = conversion_constant(value)
+            if constant is not None:
+                parts[name] = constant
+
+    h = sha256()
+    for name in sorted(parts):
+        h.update(repr((name, parts[name])).encode())
+    for section, option in conversion_options:
+        h.update(repr((section, option, config.get(section, option, fallback=None))).encode())
+    if use_python_markdown:
+        h.update(repr(('markdown', markdown.__version__)).encode())
+    # the links to attachments differ between GitHub and the migration archive
+    h.update(repr(config.has_option('target', 'token') or config.has_option('target', 'username')).encode())
+    h.update(repr(sorted(wiki_path_conversion_table.items())).encode())
+    return h.hexdigest()
+
+# The converted texts are stored next to the trac_cache, which is opened by
+# the migration (see open_conversion_cache).
+conversion_cache = None
+
+def open_conversion_cache():
+    """
+    Open the conversion cache, whose entries are all evicted if the
+    fingerprint of the converter changed.
+    """
+    global conversion_cache
+    conversion_cache = Cache('conversion_cache', size_limit=int(5e9))
+    fingerprint = conversion_fingerprint()
+    if conversion_cache.get('fingerprint') != fingerprint:
+        conversion_cache.clear()
+        conversion_cache['fingerprint'] = fingerprint
+
 RE_CAMELCASE1 = re.compile(r'(?<=\s)((?:[A-Z][a-z0-9]+){2,})(?=[\s\.\,\:\;\?\!])')
 RE_CAMELCASE2 = re.compile(r'(?<=\s)((?:[A-Z][a-z0-9]+){2,})$')
 RE_HEADING1 = re.compile(r'^(=)\s(.+)\s=\s*([\#][^\s]*)?')
@@ -372,6 +775,7 @@ RE_ITALIC1 = re.compile(r'\'\'(.*?)\'\'')
 RE_ITALIC2 = re.compile(r'(?<=\s)//(.*?)//')
 RE_TICKET1 = re.compile(r'[\s]%s/([1-9]\d{0,4})' % trac_url_ticket)
 RE_TICKET2 = re.compile(r'\#([1-9]\d{0,4})')
+RE_UNINTENDED_HEADING = re.compile(r'^(\s*)# ')
 RE_UNDERLINED_CODE1 = re.compile(r'(?<=\s)_([a-zA-Z_]+)_(?=[\s,)])')
 RE_UNDERLINED_CODE2 = re.compile(r'(?<=\s)_([a-zA-Z_]+)_$')
 RE_UNDERLINED_CODE3 = re.compile(r'^_([a-zA-Z_]+)_(?=\s)')
@@ -388,6 +792,78 @@ RE_COMMIT_LIST3 = re.compile(r'\|(.*?)\|(.*?)\|')
 RE_NEW_COMMITS = re.compile(r'(?sm)(New commits:)\n((?:\|[^\n]*\|(?:\n|$))+)')
 RE_LAST_NEW_COMMITS = re.compile(r'(?sm)(Last \d+ new commits:)\n((?:\|[^\n]*\|(?:\n|$))+)')
 
+# The inline rules applied by trac2markdown to a line outside of code blocks,
+# in the order of application. Each rule is given by its name, its regular
+# expression and a literal occurring in every match of the rule, or None if
+# the rule has no such literal. A rule is applied to a line only if its literal
+# occurs in the line (see convert_inline). The replacements are given by
+# inline_replacements.
+INLINE_RULES = [
+    ('unintended_heading', RE_UNINTENDED_HEADING, None),
+    ('heading1', RE_HEADING1, '='),
+    ('heading2', RE_HEADING2, '='),
+    ('heading3', RE_HEADING3, '='),
+    ('heading4', RE_HEADING4, '='),
+    ('heading5', RE_HEADING5, '='),
+    ('heading6', RE_HEADING6, '='),
+    ('heading1a', RE_HEADING1a, '='),
+    ('heading2a', RE_HEADING2a, '='),
+    ('heading3a', RE_HEADING3a, '='),
+    ('heading4a', RE_HEADING4a, '='),
+    ('heading5a', RE_HEADING5a, '='),
+    ('heading6a', RE_HEADING6a, '='),
+    ('underlined_code1', RE_UNDERLINED_CODE1, '_'),
+    ('underlined_code2', RE_UNDERLINED_CODE2, '_'),
+    ('underlined_code3', RE_UNDERLINED_CODE3, '_'),
+    ('code_snippet', RE_CODE_SNIPPET, '{{{'),
+    ('superscript', RE_SUPERSCRIPT1, '^'),
+    ('subscript', RE_SUBSCRIPT1, ',,'),
+    ('query', RE_QUERY1, '[query:?'),
+    ('https1', RE_HTTPS1, '[[http'),
+    ('https2', RE_HTTPS2, '[[http'),
+    ('https3', RE_HTTPS3, '[http'),
+    ('https4', RE_HTTPS4, '[http'),
+    ('image1', RE_IMAGE1, '[[Image('),
+    ('image2', RE_IMAGE2, '[[Image('),
+    ('image3', RE_IMAGE3, '[[Image('),
+    ('image4', RE_IMAGE4, '[[Image('),
+    ('image5', RE_IMAGE5, '[[Image('),
+    ('image6', RE_IMAGE6, '[[Image('),
+    ('ticket_comment1', RE_TICKET_COMMENT1, '[[ticket:'),
+    ('ticket_comment2', RE_TICKET_COMMENT2, '[[ticket:'),
+    ('ticket_comment3', RE_TICKET_COMMENT3, '[ticket:'),
+    ('ticket_comment4', RE_TICKET_COMMENT4, '[ticket:'),
+    ('ticket_comment5', RE_TICKET_COMMENT5, '[comment:ticket:'),
+    ('ticket_comment6', RE_TICKET_COMMENT6, 'ticket:'),
+    ('comment1', RE_COMMENT1, '[[comment:'),
+    ('comment2', RE_COMMENT2, '[[comment:'),
+    ('comment3', RE_COMMENT3, '[comment:'),
+    ('comment4', RE_COMMENT4, 'comment:'),
+    ('attachment1', RE_ATTACHMENT1, '[[attachment:'),
+    ('attachment2', RE_ATTACHMENT2, '[[attachment:'),
+    ('attachment3', RE_ATTACHMENT3, '[attachment:'),
+    ('attachment4', RE_ATTACHMENT4, '[attachment:'),
+    ('attachment5', RE_ATTACHMENT5, 'attachment:'),
+    ('attachment6', RE_ATTACHMENT6, 'attachment:'),
+    ('attachment7', RE_ATTACHMENT7, 'attachment:'),
+    ('attachment8', RE_ATTACHMENT8, 'attachment:'),
+    ('linebreak1', RE_LINEBREAK1, '[[br]]'),
+    ('linebreak2', RE_LINEBREAK2, '[[BR]]'),
+    ('wiki4', RE_WIKI4, '[wiki:'),
+    ('wiki5', RE_WIKI5, '[wiki:'),
+    ('wiki6', RE_WIKI6, '[wiki:'),
+    ('wiki7', RE_WIKI7, '[/wiki/'),
+    ('source1', RE_SOURCE1, '[source:'),
+    ('source2', RE_SOURCE2, 'source:'),
+    ('boldtext', RE_BOLDTEXT1, "'''"),
+    ('italic1', RE_ITALIC1, "''"),
+    ('italic2', RE_ITALIC2, '//'),
+    ('ticket1', RE_TICKET1, os.path.basename(trac_url_ticket) + '/'),
+    ('ticket2', RE_TICKET2, '#'),
+    ('github_mention1', RE_GITHUB_MENTION1, '@'),
+    ('github_mention2', RE_GITHUB_MENTION2, '@'),
+]
+
 class CodeTag:
     """
     Handler for code protectors.
@@ -718,78 +1194,644 @@ def github_mention(match):
         return '@' + github_username
     return '`@`' + username
 
-def trac2markdown(text, base_path, conv_help, multilines=default_multilines):
-    # conversion of url
-    text = trac_url_conv_help.sub(text)
-    text = cgit_conv_help.sub(text)
+def inline_replacements(conv_help, base_path, heading_replace):
+    """
+    Return the list of the replacements for the rules in ``INLINE_RULES``
+    outside of tables.
+    """
+    source_path = os.path.relpath('/tree/master/', base_path)
+    replacements = {
+        'unintended_heading': r'\1\# ',  # first fix unintended heading
+        'underlined_code': r'`_\1_`',  # code surrounded by underline, mistaken as italics by github
+        'code_snippet': inline_code_snippet,
+        'superscript': r'<sup>\1</sup>',  # superscript ^abc^
+        'subscript': r'<sub>\1</sub>',  # subscript ,,abc,,
+        'query': r'[%s?' % trac_url_query,  # preconversion to URL format
+        'https': conv_help.wiki_link,
+        'image1': conv_help.image_link_under_tree,
+        'image2': conv_help.image_link,
+        'image3': conv_help.image_link,
+        'image4': r'<img src="\1" \2>',
+        'image5': conv_help.wiki_image,  # \2 is image width
+        'image6': conv_help.image_link,  # \2 is image width, \3 is alignment
+        'ticket_comment': conv_help.ticket_comment_link,
+        'comment': conv_help.comment_link,
+        'attachment': conv_help.attachment,
+        'linebreak': '\n',
+        'wiki': conv_help.wiki_link,
+        'source1': r'[\2](%s/\1)' % source_path,
+        'source2': r'[\1](%s/\1)' % source_path,
+        'boldtext': r'**\1**',
+        'italic': r'*\1*',
+        'ticket1': r' #\1',  # replace global ticket references
+        'ticket2': conv_help.ticket_link,
+        'github_mention': github_mention,  # to avoid unintended github mention
+    }
+    result = []
+    for name, regex, literal in INLINE_RULES:
+        if name.startswith('heading'):
+            result.append(heading_replace)
+        elif name in replacements:
+            result.append(replacements[name])
+        else:
+            result.append(replacements[name.rstrip('0123456789')])
+    return result
 
-    # some normalization
-    text = RE_WRONG_FORMAT1.sub(r'ticket:\2#comment:\1', text)
-    text = RE_REPLYING_TO.sub(convert_replying_to, text)
-    text = RE_REPLYING_TO_TICKET.sub(convert_replying_to_ticket, text)
+# the indices of the rules in INLINE_RULES converting line breaks
+inline_linebreak_rules = [i for i, (name, regex, literal) in enumerate(INLINE_RULES)
+                          if name.startswith('linebreak')]
 
-    text = re.sub('\r\n', '\n', text)
-    text = re.sub(r'\swiki:([a-zA-Z]+)', r' [wiki:\1]', text)
+def table_inline_replacements(replacements):
+    """
+    Return the replacements of ``inline_replacements`` for a line in a table.
+    """
+    replacements = list(replacements)
+    for i in inline_linebreak_rules:
+        replacements[i] = '<br>'
+    return replacements
 
-    text = re.sub(r'\[\[TOC[^]]*\]\]', '', text)
-    text = re.sub(r'(?m)\[\[PageOutline\]\]\s*\n', '', text)
+def convert_inline(line, replacements):
+    """
+    Return the line converted by the rules in ``INLINE_RULES``.
+    """
+    # skip the rules whose literal does not occur in the line as converted
+    # by the rules before; a rule without literal is always applied
+    for (name, regex, literal), replacement in zip(INLINE_RULES, replacements):
+        if literal is None or literal in line:
+            conversion_step(name)
+            line = regex.sub(replacement, line)
+    return line
+
+RE_MD_CODE = re.compile(r'(?<!\\)((?:\\\\)*)(`+)(.+?)(?<!`)\2(?!`)', re.DOTALL)
+RE_MD_ESCAPE = re.compile(r'\\([\\`*_{}\[\]()>#+\-.!|])')
+RE_MD_LINK_START = re.compile(r"""\(\s*(?:(<[^<>]*>)\s*(?:('[^']*'|"[^"]*")\s*)?\))?""")
+RE_MD_LINK_TITLE = re.compile(r"""(.*?)\s*('[^']*'|"[^"]*")\s*""", re.DOTALL)
+RE_MD_AUTOLINK = re.compile(r'<((?:[Ff]|[Hh][Tt])[Tt][Pp][Ss]?://[^<>]*)>')
+RE_MD_HTML = re.compile(r"""<(?:/?[a-zA-Z][^\s"'<>@]*(?:\s+[^\s"'=<>]+(?:\s*=\s*(?:"[^"]*"|'[^']*'|[^\s"'=<>]+))?)*\s*/?
+                              |!--(?:(?!<!--|-->).)*--|[?](?:(?!<[?]|[?]>).)*[?]|!\[CDATA\[(?:(?!<!\[CDATA\[|\]\]>).)*\]\])>""", re.VERBOSE)
+RE_MD_ENTITY = re.compile(r'&(?:\#[0-9]+|\#x[0-9a-fA-F]+|[a-zA-Z0-9]+);')
+RE_MD_TABLE_PIPES = re.compile(r'(\\\\)|(\\`+)|(`+)|(\\\|)|(\|)')
+RE_MD_TABLE_END_BORDER = re.compile(r'(?<!\\)(?:\\\\)*\|$')
+
+def markdown_link(text, index):
+    """
+    Return the text, the target, the title and the end of the Markdown link
+    whose text starts at ``index``, or ``None``.
+    """
+    depth = 1
+    for end in range(index, len(text)):
+        if text[end] == '[':
+            depth += 1
+        elif text[end] == ']':
+            depth -= 1
+            if not depth:
+                break
+    else:
+        return None
+    m = RE_MD_LINK_START.match(text, end + 1)
+    if not m:
+        return None
+    title = None
+    if m.group(1):
+        href = m.group(1)[1:-1]
+        if m.group(2):
+            title = m.group(2)[1:-1]
+        stop = m.end()
+    else:
+        depth = 1
+        for stop in range(m.end(), len(text)):
+            if text[stop] == '(':
+                depth += 1
+            elif text[stop] == ')':
+                depth -= 1
+                if not depth:
+                    break
+        else:
+            return None
+        href = text[m.end():stop]
+        if t := RE_MD_LINK_TITLE.fullmatch(href):
+            href, title = t.group(1), t.group(2)[1:-1]
+        stop += 1
+    if title is not None:
+        title = re.sub(r'\s', ' ', title.strip())
+    return text[index:end], href.strip(), title, stop
+
+def markdown_delimiter_run(text, start):
+    """
+    Return the kind of the run of ``*`` or ``_`` starting at ``start`` and
+    its end, as python-markdown classifies the runs for emphasis: 'start',
+    'end', 'both' or ``None`` if the run can neither open nor close.
 
-    if multilines:
-        text = re.sub(r'^\S[^\n]+([^=-_|])\n([^\s`*0-9#=->-_|])', r'\1 \2', text)
+    The placeholders of the stashed markup count as punctuation after an
+    opening and before a closing run.
+    """
+    token = text[start]
+    end = start
+    while end < len(text) and text[end] == token:
+        end += 1
+    before = text[start - 1] if start else None
+    after = text[end] if end < len(text) else None
+
+    def punctuation(c):
+        return c is not None and unicodedata.category(c)[0] in 'PS'
+
+    def flanking(c):
+        return c is not None and not c.isspace() and not punctuation(c)
+
+    # an underscore does not delimit within a word
+    left = token == '*' or not (before is not None and (before.isalnum() or before == '_'))
+    right = token == '*' or not (after is not None and (after.isalnum() or after == '_'))
+    # within a run, only the rest of the run can open
+    within = before == token
+    if ((flanking(before) and left and right and flanking(after))
+        or (not within and before is not None and after is not None
+            and (punctuation(before) or before == '\x03') and (punctuation(after) or after == '\x02'))):
+        return 'both', end
+    if ((flanking(before) and right)
+        or (not within and punctuation(before)
+            and (after is None or after.isspace() or after == '\x02' or punctuation(after)))):
+        return 'end', end
+    if ((left and flanking(after))
+        or (not within and (before is None or before.isspace() or before == '\x03' or punctuation(before))
+            and punctuation(after))):
+        return 'start', end
+    return None, end
+
+def markdown_emphasis_regions(text, index):
+    """
+    Return the emphasis regions opened by the run of ``*`` or ``_`` at
+    ``index`` and the index to continue from.
 
-    def heading_replace(match):
+    The runs are paired as by the delimiter processor of python-markdown: a
+    region is a tuple of the start and end of its opening run, the start and
+    end of its closing run and its size, 2 for strong and 1 for emphasized.
+    """
+    kind, end = markdown_delimiter_run(text, index)
+    if kind in (None, 'end'):
+        return [], end
+    stacks = {'*': [], '_': []}
+    stacks[text[index]].append((index, end, kind == 'both', end - index))
+    regions = []
+
+    def add_region(a, b, c, d, size):
+        regions.append((a, b, c, d, size))
+        # the openings within the region are text
+        for stack in stacks.values():
+            while stack and a <= stack[-1][0] < d:
+                stack.pop()
+
+    while any(stacks.values()):
+        start = end
+        while start < len(text):
+            if text[start] in stacks:
+                kind, end = markdown_delimiter_run(text, start)
+                if kind is not None and (stacks[text[start]] or kind != 'end'):
+                    break
+            start += 1
+        else:
+            break
+        stack = stacks[text[start]]
+        current = end - start
+        is_start = kind != 'end'
+        is_end = kind != 'start'
+        is_ambiguous = kind == 'both'
+        last = stack[-1][3] if stack else 0
+
+        if stack and is_end and ((not is_ambiguous and current > last) or current == last or current >= 3):
+            is_start = False
+            original = current
+            while stack and current and last <= current:
+                delimiter = stack.pop()
+                size = min(delimiter[3], 1 if delimiter[3] == 3 else 2)
+                add_region(delimiter[1] - size, delimiter[1], start, start + size, size)
+                start += size
+                current -= size
+                if size < delimiter[3]:
+                    stack.append((delimiter[0], delimiter[1] - size, delimiter[2], delimiter[3] - size))
+                if not stack:
+                    if any(stacks.values()):
+                        continue
+                    is_end = False
+                    break
+                last = stack[-1][3]
+            if original >= 3 and current and is_ambiguous:
+                stack.append((start, end, False, current))
+                is_end = False
+            else:
+                is_end = current and stack and last > current
+
+        if stack and is_end and (last >= 3 or not is_ambiguous) and last > current:
+            delimiter = stack.pop()
+            # an ambiguous opening only pairs if it has three characters
+            while stack and delimiter[3] != 3 and delimiter[2]:
+                delimiter = stack.pop()
+                last = delimiter[3]
+            if delimiter[2] and delimiter[3] != 3:
+                if any(other for other in stacks.values() if other is not stack):
+                    stack.clear()
+                    continue
+                break
+            is_start = False
+            opening_start, opening_end = delimiter[:2]
+            while current:
+                size = min(current, 1 if current == 3 else 2)
+                add_region(opening_start + last - size, opening_end, start, start + size, size)
+                start += size
+                current -= size
+                last -= size
+                opening_end -= size
+            if last:
+                stack.append((opening_start, opening_end, False, last))
+
+        if is_start:
+            stack.append((start, end, is_ambiguous, current))
+
+    if not regions:
+        # skip the openings that were not closed
+        openings = sorted(opening for stack in stacks.values() for opening in stack)
+        return [], openings[-1][1] if openings else index + 1
+    regions.sort()
+    return regions, max(region[3] for region in regions)
+
+def markdown_inline_html(text):
+    """
+    Return the HTML of a Markdown text without block structure.
+
+    Only the inline markup produced by trac2markdown is rendered: code,
+    links, images, line breaks, raw HTML, strong and emphasized text.
+    """
+    stash = []
+
+    def store(markup):
+        stash.append(markup)
+        return '\x02%d\x03' % (len(stash) - 1)
+
+    def restore(text):
+        while '\x02' in text:
+            text = re.sub('\x02([0-9]+)\x03', lambda m: stash[int(m.group(1))], text)
+        return text
+
+    def links(text):
+        pieces = []
+        pos = index = 0
+        while (index := text.find('[', index)) >= 0:
+            link = markdown_link(text, index + 1)
+            if link is None:
+                index += 1
+                continue
+            link_text, href, title, end = link
+            href = html.escape(restore(href))
+            title = '' if title is None else ' title="%s"' % html.escape(title)
+            if index > pos and text[index - 1] == '!':
+                pieces.append(text[pos:index - 1])
+                pieces.append(store('<img alt="%s" src="%s"%s />'
+                                    % (html.escape(restore(link_text)), href, title)))
+            else:
+                pieces.append(text[pos:index])
+                # the text of the link is not searched for links again
+                pieces.append(store('<a href="%s"%s>%s</a>'
+                                    % (href, title, html.escape(emphasis(raw(link_text)), quote=False))))
+            pos = index = end
+        pieces.append(text[pos:])
+        return ''.join(pieces)
+
+    def raw(text):
+        text = RE_MD_AUTOLINK.sub(lambda m: store('<a href="%s">%s</a>' % (html.escape(m.group(1)),
+                                                                           html.escape(m.group(1), quote=False))), text)
+        text = text.replace('  \n', store('<br />\n'))
+        text = RE_MD_HTML.sub(lambda m: store(m.group(0)), text)
+        return RE_MD_ENTITY.sub(lambda m: store(m.group(0)), text)
+
+    def emphasis(text):
+        index = 0
+        while (index := min((i for i in (text.find('*', index), text.find('_', index)) if i >= 0),
+                            default=-1)) >= 0:
+            regions, end = markdown_emphasis_regions(text, index)
+            if not regions:
+                index = end
+                continue
+            head = region_html(text, regions, 0, end)
+            text = head + text[end:]
+            index = len(head)
+        return text
+
+    def region_html(text, regions, pos, end, top=True, tails=False):
+        # the regions are sorted, each one is stashed with the regions it
+        # contains; as in python-markdown, the texts after the regions in the
+        # last one are searched for emphasis again
+        pieces = []
+        while regions:
+            a, b, c, d, size = regions[0]
+            count = 1
+            while count < len(regions) and regions[count][0] >= b and regions[count][3] <= c:
+                count += 1
+            tag = 'strong' if size == 2 else 'em'
+            pieces.append(emphasis(text[pos:a]) if tails and pieces else text[pos:a])
+            content = region_html(text, regions[1:count], b, c, False, top and count == len(regions))
+            pieces.append(store('<%s>%s</%s>' % (tag, html.escape(content, quote=False), tag)))
+            regions = regions[count:]
+            pos = d
+        pieces.append(emphasis(text[pos:end]) if tails and pieces else text[pos:end])
+        return ''.join(pieces)
+
+    text = RE_MD_CODE.sub(lambda m: store('\\' * (len(m.group(1)) // 2) + '<code>%s</code>'
+                                          % html.escape(m.group(3).strip(), quote=False)), text)
+    text = RE_MD_ESCAPE.sub(lambda m: store(html.escape(m.group(1), quote=False)), text)
+    text = emphasis(raw(links(text)))
+    return restore(html.escape(text, quote=False))
+
+def markdown_table_cells(row, border):
+    """
+    Return the cells of a row of a Markdown table.
+
+    As in the tables extension of python-markdown, the pipes in code are
+    not cell separators: a run of backticks opens a code span that is closed
+    by the next run of the same length.
+    """
+    if border:
+        if row.startswith('|'):
+            row = row[1:]
+        row = RE_MD_TABLE_END_BORDER.sub('', row)
+    tics = []
+    pipes = []
+    for m in RE_MD_TABLE_PIPES.finditer(row):
+        if m.group(2):
+            # an escaped run of backticks only opens a code span of one backtick less
+            tics.append((len(m.group(2)) - 1, m.start(2), m.end(2) - 1, 1))
+        elif m.group(3):
+            tics.append((len(m.group(3)), m.start(3), m.end(3) - 1, 0))
+        elif m.group(5):
+            pipes.append(m.start(5))
+    code = []
+    pos = 0
+    while pos < len(tics):
+        size = tics[pos][0] - tics[pos][3]
+        close = next((i for i in range(pos + 1, len(tics)) if tics[i][0] == size), None) if size else None
+        if close is None:
+            pos += 1
+            continue
+        code.append((tics[pos][1], tics[close][2]))
+        pos = close + 1
+    cells = []
+    pos = 0
+    for pipe in pipes:
+        if not any(start <= pipe <= end for start, end in code):
+            cells.append(row[pos:pipe].strip())
+            pos = pipe + 1
+    cells.append(row[pos:].strip())
+    return cells
+
+def markdown_table_html(table):
+    """
+    Return the HTML of a Markdown table given by its rows.
+
+    The first row is the header and the second the separator row, as for
+    the tables extension of python-markdown with align attributes, which
+    renders the tables instead if ``python_markdown_tables`` is yes.
+    """
+    rows = [row.strip() for row in table]
+    paragraph = '<p>%s</p>' % markdown_inline_html('\n'.join(table).strip())
+    if len(rows) < 2:
+        return paragraph
+
+    border = rows[0].startswith('|') or RE_MD_TABLE_END_BORDER.search(rows[0]) is not None
+    header = markdown_table_cells(rows[0], border)
+    separator = markdown_table_cells(rows[1], border)
+    if len(header) == 1 and not (border and all(row.startswith('|') or RE_MD_TABLE_END_BORDER.search(row)
+                                                for row in rows[1:])):
+        return paragraph
+    if len(header) != len(separator) or not set(''.join(separator)) <= set('|:- '):
+        return paragraph
+
+    align = []
+    for c in separator:
+        if c.startswith(':') and c.endswith(':'):
+            align.append(' align="center"')
+        elif c.startswith(':'):
+            align.append(' align="left"')
+        elif c.endswith(':'):
+            align.append(' align="right"')
+        else:
+            align.append('')
+
+    def html_row(row, tag):
+        cells = markdown_table_cells(row, border) if row is not None else []
+        cells += [''] * (len(align) - len(cells))
+        return ['<tr>'] + ['<%s%s>%s</%s>' % (tag, a, markdown_inline_html(cell), tag)
+                           for a, cell in zip(align, cells)] + ['</tr>']
+
+    lines = ['<table>', '<thead>'] + html_row(rows[0], 'th') + ['</thead>', '<tbody>']
+    for row in rows[2:] or [None]:
+        lines += html_row(row, 'td')
+    lines += ['</tbody>', '</table>']
+    return '\n'.join(lines)
+
+RE_BRACKET = re.compile(r'[\[\]]')
+
+def convert_outside_brackets(line, convert):
+    """
+    Return the line with ``convert`` applied to the parts outside of brackets.
+
+    The brackets are matched by their depth. The part after an unclosed
+    bracket is converted. An unmatched closing bracket makes the depth
+    negative, so that the next brackets are converted with the text around
+    them.
+    """
+    if '[' not in line and ']' not in line:
+        return convert(line) if line else line
+    pieces = []
+    depth = 0
+    start = 0
+    for m in RE_BRACKET.finditer(line):
+        i = m.start()
+        if line[i] == '[':
+            if depth == 0 and i > start:
+                pieces.append(convert(line[start:i]))
+                start = i
+            depth += 1
+        else:
+            depth -= 1
+            if depth == 0:
+                pieces.append(line[start:i + 1])
+                start = i + 1
+    if len(line) > start:
+        pieces.append(convert(line[start:]))
+    return ''.join(pieces)
+
+def convert_outside_code(line, convert):
+    """
+    Return the line with ``convert`` applied to the parts outside of inline
+    code between backticks.
+    """
+    parts = line.split('`')
+    for i in range(0, len(parts), 2):
+        parts[i] = convert(parts[i])
+    return '`'.join(parts)
+
+def table_header_row(line):
+    """
+    Return the first row ``line`` of a Trac table with the header separator
+    of Markdown, and with an empty header if the row is not one.
+    """
+    # construct header separator
+    parts = line.split('||')
+    sep = []
+    for part in parts:
+        if part.startswith('='):
+            part = part[1:]
+            start = ':'
+        else:
+            start = ''
+        if part.endswith('='):
+            part = part[:-1]
+            end = ':'
+        else:
+            end = ''
+        sep.append(start + '-'*len(part) + end)
+    sep = '||'.join(sep)
+    if ':' in sep:
+        return line + '\n' + sep
+    # perhaps a table without header; github table needs header
+    header = re.sub(r'[^|]', ' ', sep)
+    return header + '\n' + sep + '\n' + line
+
+def table_row(line):
+    """
+    Return the row ``line`` of a Trac table as a row of Markdown.
+    """
+    # The wiki markup allows the alignment directives to be specified on a cell-by-cell
+    # basis. This is used in many examples. AFAIK this can't be properly translated into
+    # the GitHub markdown as it only allows to align statements column by column.
+    line = line.replace('||=', '||')  # ignore cellwise align instructions
+    line = line.replace('=||', '||')  # ignore cellwise align instructions
+    return line.replace('||', '|')
+
+class TracLine:
+    """
+    Line of a Trac document without its quote prefix.
+    """
+    def __init__(self, text, quote_prefix, in_code=False, in_html=False, in_td=False, quote_break=False):
+        self.text = text
+        self.quote_prefix = quote_prefix
+        # processor blocks the line is converted in
+        self.in_code = in_code
+        self.in_html = in_html
+        self.in_td = in_td
+        # empty line inserted when the quote depth decreases
+        self.quote_break = quote_break
+        # role of the line in a table, see TracTable
+        self.table_role = None
+        self.table_header = False
+
+class TracBlock:
+    """
+    Processor block ``{{{ ... }}}`` of a Trac document, or the document itself.
+
+    Only the parse is tree-based; the rendering goes through the lines in
+    document order. If some lines of a closed block are indented less than
+    its opening braces, the renderer patches the last ``n`` lines of its
+    output buffer before the closing line, indenting them by the difference
+    ``defect``, where ``n`` is the number of lines in the block, not counting
+    nested braces.
+    """
+    def __init__(self, kind, level=0, indent=0):
+        self.kind = kind  # 'document', 'code', 'html' or 'td'
+        self.level = level
+        self.indent = indent
+        self.defect = 0
+        self.n = 0
+        self.opening = None
+        self.closing = None
+        self.children = []  # lines, tables and blocks in document order
+        # for the document: whether a code or html block is left open, and
+        # the most rendered lines indented when a block is closed
+        self.unclosed = False
+        self.lookback = 0
+
+    def lines(self):
         """
-        Return the replacement for the heading
+        Iterate over the lines of the block, each with the block it closes
+        or ``None``.
         """
-        level = len(match.group(1))
-        heading = match.group(2).rstrip()
+        if self.opening:
+            yield self.opening, None
+        for child in self.children:
+            if isinstance(child, TracLine):
+                yield child, None
+            else:
+                yield from child.lines()
+        if self.closing:
+            yield self.closing, self
 
-        if not isinstance(conv_help, IssuesConversionHelper) and create_wiki_link_conversion_table:
-            with open('wiki_path_conversion_table.txt', "a") as f:
-                f.write(conv_help._trac_wiki_path + '#' + heading.replace(' ', '') + ' '
-                        + conv_help._wiki_path + '#' + heading.replace(' ', '-'))
-                f.write('\n')
+class TracTable:
+    """
+    Table of a Trac document, which is rendered before the line following it.
+
+    The ``table_role`` of its lines is
+    - ``'continued_header'`` for the start of a header row continued by ``\\``,
+    - ``'row'`` for a row and ``'continued_row'`` for the start of a row
+      continued by ``\\``,
+    - ``'lead'`` for ``||\\`` leading the td blocks of a row, ``'td_open'``,
+      ``'td_line'`` and ``'td_close'`` for the lines of the td blocks, and
+      ``'end'`` for ``||`` ending the row,
+    - ``'following'`` for the line following the table, which is not part of it.
+    The first row also has ``table_header`` set. The lines of a table that
+    outlasts the td block it starts in follow that block.
+    """
+    def __init__(self):
+        self.children = []  # lines and td blocks in document order
 
-        # There might be a second item if an anchor is set.
-        # We ignore this anchor since it is automatically
-        # set it GitHub Markdown.
-        return '#'*level + ' ' + heading
+    def lines(self):
+        """
+        Iterate over the lines of the table, each with the block it closes
+        or ``None``.
+        """
+        for child in self.children:
+            if isinstance(child, TracLine):
+                yield child, None
+            else:
+                yield from child.lines()
 
-    a = []
+def parse_trac_blocks(text):
+    """
+    Return the tree of the processor blocks and tables of the Trac wiki text.
+
+    The quote prefixes are cut from the lines, and the opening and closing
+    lines of the blocks are converted to the protection tags of ``proc_code``
+    and ``proc_td``.
+    """
+    document = TracBlock('document')
+    blocks = [document]  # blocks containing the current line, innermost last
+    code = html_block = td = None  # the open processor blocks
+    table = None  # the current table
+    in_table = False  # whether the header row of the current table was found
+    table_empty = True  # whether no row of the current table is rendered yet
+    cells_empty = True  # whether the current row of td blocks is empty
+    continued = ''  # start of a continued table row, joined with the next line
     level = 0
-    in_td = False
-    in_code = False
-    in_html = False
-    in_list = False
-    in_table = False
     quote_depth_decreased = False
-    block = []
-    table = []
-    list_indents = []
-    previous_line = ''
     quote_prefix = ''
     text_lines = text.split('\n') + ['']
     text_lines.reverse()
-    line = True
+    non_blank = True
     while text_lines:
-        non_blank_previous_line = bool(line)
+        non_blank_previous_line = non_blank
         line = text_lines.pop()
 
         # cut quote prefix
         if line.startswith(quote_prefix):
             line = line[len(quote_prefix):]
         else:
-            if in_code or in_html:  # to recover from interrupted codeblock
+            if code or html_block:  # to recover from interrupted codeblock
                 text_lines.append(line)  # put it back
                 text_lines.append(quote_prefix + '}}}')
-                line = non_blank_previous_line
                 continue
 
             if line:  # insert a blank line when quote depth decreased
                 quote_depth_decreased = True
             quote_prefix = ''
 
-        if not (in_code or in_html):
+        if not (code or html_block):
             # quote
             prefix = ''
             m = re.match('^((?:>\s)*>\s)', line)
@@ -800,51 +1842,39 @@ def trac2markdown(text, base_path, conv_help, multilines=default_multilines):
                 prefix += m.group(1)
             quote_prefix += prefix
             if quote_depth_decreased:
-                a.append(quote_prefix)
+                blocks[-1].children.append(TracLine('', quote_prefix, quote_break=True))
                 quote_depth_decreased = False
             line = line[len(prefix):]
 
-        if previous_line:
-            line = previous_line + line
-            previous_line = ''
-
-        line_temporary = line.lstrip()
-        if line_temporary.startswith('{{{') and in_code:
+        # a continued table row is joined with this line by render_trac_lines
+        logical_line = continued + line
+        line_temporary = logical_line.lstrip()
+        opening = closing = None
+        if line_temporary.startswith('{{{') and code:
             level += 1
         elif re.match(r'{{{\s*#!td', line_temporary):
-            in_td = True
-            in_td_level = level
-            in_td_prefix = re.search('{{{', line).start()
-            in_td_n = 0
-            in_td_defect = 0
-            line =  re.sub(r'{{{\s*#!td', r'%s' % proc_td.open, line)
+            td = opening = TracBlock('td', level, re.search('{{{', line).start())
+            line = re.sub(r'{{{\s*#!td', r'%s' % proc_td.open, line)
             level += 1
-        elif re.match(r'{{{\s*#!html', line_temporary) and not (in_code or in_html):
-            in_html = True
-            in_html_level = level
-            in_html_prefix = re.search('{{{', line).start()
-            in_html_n = 0
-            in_html_defect =0
-            line =  re.sub(r'{{{\s*#!html', r'', line)
+        elif re.match(r'{{{\s*#!html', line_temporary) and not (code or html_block):
+            html_block = opening = TracBlock('html', level, re.search('{{{', line).start())
+            line = re.sub(r'{{{\s*#!html', r'', line)
             level += 1
-        elif re.match(r'{{{\s*#!', line_temporary) and not (in_code or in_html):  # code: python, diff, ...
-            in_code = True
-            in_code_level = level
-            in_code_prefix = re.search('{{{', line).start()
-            in_code_n = 0
-            in_code_defect = 0
+        elif re.match(r'{{{\s*#!', line_temporary) and not (code or html_block):  # code: python, diff, ...
+            code = opening = TracBlock('code', level, re.search('{{{', line).start())
             if non_blank_previous_line:
                 line = '\n' + line
-            line =  re.sub(r'{{{\s*#!([^\s]+)', r'%s\1' % proc_code.open, line)
+            line = re.sub(r'{{{\s*#!([^\s]+)', r'%s\1' % proc_code.open, line)
             level += 1
-        elif line_temporary.rstrip() == '{{{' and not (in_code or in_html):
+        elif line_temporary.rstrip() == '{{{' and not (code or html_block):
             # check dangling #!...
             next_line = text_lines.pop()
             if next_line.startswith(quote_prefix):
-                m =  re.match('#!([a-zA-Z]+)', next_line[len(quote_prefix):].strip())
+                m = re.match('#!([a-zA-Z]+)', next_line[len(quote_prefix):].strip())
                 if m:
                     if m.group(1) == 'html':
                         text_lines.append(quote_prefix + line.replace('{{{', '{{{#!html'))
+                        non_blank = True
                         continue
                     line = line.rstrip() + m.group(1)
                 else:
@@ -852,184 +1882,577 @@ def trac2markdown(text, base_path, conv_help, multilines=default_multilines):
             else:
                 text_lines.append(next_line)
 
-            in_code = True
-            in_code_level = level
-            in_code_prefix = re.search('{{{', line).start()
-            in_code_n = 0
-            in_code_defect = 0
-            if line_temporary.rstrip() == '{{{':
-                if non_blank_previous_line:
-                    line = '\n' + line
-                line = line.replace('{{{', proc_code.open, 1)
-            else:
-                if non_blank_previous_line:
-                    line = '\n' + line
-                line = line.replace('{{{', proc_code.open + '\n' , 1)
+            code = opening = TracBlock('code', level, re.search('{{{', line).start())
+            if non_blank_previous_line:
+                line = '\n' + line
+            line = line.replace('{{{', proc_code.open, 1)
             level += 1
         elif line_temporary.rstrip() == '}}}':
             level -= 1
-            if in_td and in_td_level == level:
-                in_td = False
-                in_td_prefix = 0
-                if in_td_defect > 0:
-                    for i in range(in_td_n):
-                        prev_line = a[-i-1]
-                        a[-i-1] = prev_line[:len(quote_prefix)] + in_td_defect*' ' + prev_line[len(quote_prefix):]
-                line =  re.sub(r'}}}', r'%s' % proc_td.close, line)
-            elif in_html and in_html_level == level:
-                in_html = False
-                id_html_prefix = 0
-                if in_html_defect > 0:
-                    for i in range(in_html_n):
-                        prev_line = a[-i-1]
-                        a[-i-1] = prev_line[:len(quote_prefix)] + in_html_defect*' ' + prev_line[len(quote_prefix):]
-                line =  re.sub(r'}}}', r'', line)
-            elif in_code and in_code_level == level:
-                in_code = False
-                in_code_prefix = 0
-                if in_code_defect > 0:
-                    for i in range(in_code_n):
-                        prev_line = a[-i-1]
-                        a[-i-1] = prev_line[:len(quote_prefix)] + in_code_defect*' ' + prev_line[len(quote_prefix):]
-                line =  re.sub(r'}}}', r'%s' % proc_code.close, line)
+            if td and td.level == level:
+                closing, td = td, None
+                line = re.sub(r'}}}', r'%s' % proc_td.close, line)
+            elif html_block and html_block.level == level:
+                closing, html_block = html_block, None
+                line = re.sub(r'}}}', r'', line)
+            elif code and code.level == level:
+                closing, code = code, None
+                line = re.sub(r'}}}', r'%s' % proc_code.close, line)
+            if closing and closing.defect > 0:
+                document.lookback = max(document.lookback, closing.n)
         else:
             # adjust badly indented codeblocks
-            if in_td:
-                if line.strip():
-                    indent = re.search('[^\s]', line).start()
-                    if indent < in_td_prefix:
-                        in_td_defect = max(in_td_defect, in_td_prefix - indent)
-                in_td_n += 1
-            if in_html:
-                if line.strip():
-                    indent = re.search('[^\s]', line).start()
-                    if indent < in_html_prefix:
-                        in_html_defect = max(in_html_defect, in_html_prefix - indent)
-                in_html_n += 1
-            if in_code:
-                if line.strip():
-                    indent = re.search('[^\s]', line).start()
-                    if indent < in_code_prefix:
-                        in_code_defect = max(in_code_defect, in_code_prefix - indent)
-                in_code_n += 1
+            for block in (td, html_block, code):
+                if block:
+                    if logical_line.strip():
+                        indent = re.search('[^\s]', logical_line).start()
+                        if indent < block.indent:
+                            block.defect = max(block.defect, block.indent - indent)
+                    block.n += 1
+
+        node = TracLine(line, quote_prefix, bool(code), bool(html_block), bool(td))
+
+        # tables
+        logical_line = continued + line
+        continued = ''
+        if logical_line.startswith('||') and not (code or html_block):
+            if table is None:
+                table = TracTable()
+                blocks[-1].children.append(table)
+                blocks.append(table)
+            if not in_table:
+                if logical_line.endswith('||\\'):
+                    continued = logical_line[:-3]
+                    node.table_role = 'continued_header'
+                elif logical_line.endswith('|| \\'):
+                    continued = logical_line[:-4]
+                    node.table_role = 'continued_header'
+                else:
+                    logical_line = table_header_row(logical_line)
+                    node.table_header = in_table = True
+            if in_table:
+                logical_line = table_row(logical_line)
+        if in_table:
+            if logical_line in ('|\\', '| \\'):
+                node.table_role = 'lead'
+                cells_empty = True
+            elif logical_line == '|':
+                node.table_role = 'end'
+                table_empty = False
+                cells_empty = True
+            elif logical_line.startswith(proc_td.open):
+                node.table_role = 'td_open'
+                cells_empty = False
+            elif td:
+                node.table_role = 'td_line'
+                cells_empty = False
+            elif logical_line.startswith(proc_td.close):
+                node.table_role = 'td_close'
+                cells_empty = False
+            elif logical_line.startswith('|'):
+                if logical_line.endswith('|\\'):
+                    continued = logical_line[:-2].replace('|', '||')
+                    node.table_role = 'continued_row'
+                elif logical_line.endswith('| \\'):
+                    continued = logical_line[:-3].replace('|', '||')
+                    node.table_role = 'continued_row'
+                else:
+                    node.table_role = 'row'
+                    table_empty = False
+            else:
+                node.table_role = 'following'
+                if not (table_empty and cells_empty):
+                    # the table is rendered before the line
+                    logical_line = '|\n' + logical_line
+                in_table = False
+                table_empty = cells_empty = True
+        non_blank = bool(logical_line)
+
+        if node.table_role == 'following':
+            # the blocks opened in the table stay open
+            if table in blocks:
+                blocks.remove(table)
+            table = None
+        if opening:
+            opening.opening = node
+            blocks[-1].children.append(opening)
+            blocks.append(opening)
+        elif closing:
+            closing.closing = node
+            while blocks.pop() is not closing:
+                pass
+        else:
+            blocks[-1].children.append(node)
 
-        # CamelCase wiki link
-        if not (in_code or in_html or in_td):
-            new_line = ''
-            depth = 0
-            start = 0
-            end = 0
-            l = len(line)
-            for i in range(l + 1):
-                if i == l:
-                    end = i
-                elif line[i] == '[':
-                    if depth == 0:
-                        end = i
-                    depth += 1
-                elif line[i] == ']':
-                    depth -= 1
-                    if depth == 0:
-                        start = i + 1
-                        new_line += line[end:start]
-                if end > start:
-                    converted_part = RE_CAMELCASE1.sub(conv_help.camelcase_wiki_link, line[start:end])
-                    converted_part = RE_CAMELCASE2.sub(conv_help.camelcase_wiki_link, converted_part)
-                    new_line += converted_part
-
-                    start = end
-
-            line = new_line
+    document.unclosed = bool(code or html_block)
+    return document
 
-        if not (in_code or in_html):
-            # heading
-            line = re.sub(r'^(\s*)# ', r'\1\# ', line)  # first fix unintended heading
-            line = RE_HEADING1.sub(heading_replace, line)
-            line = RE_HEADING2.sub(heading_replace, line)
-            line = RE_HEADING3.sub(heading_replace, line)
-            line = RE_HEADING4.sub(heading_replace, line)
-            line = RE_HEADING5.sub(heading_replace, line)
-            line = RE_HEADING6.sub(heading_replace, line)
-            line = RE_HEADING1a.sub(heading_replace, line)
-            line = RE_HEADING2a.sub(heading_replace, line)
-            line = RE_HEADING3a.sub(heading_replace, line)
-            line = RE_HEADING4a.sub(heading_replace, line)
-            line = RE_HEADING5a.sub(heading_replace, line)
-            line = RE_HEADING6a.sub(heading_replace, line)
-
-            # code surrounded by underline, mistaken as italics by github
-            line = RE_UNDERLINED_CODE1.sub(r'`_\1_`', line)
-            line = RE_UNDERLINED_CODE2.sub(r'`_\1_`', line)
-            line = RE_UNDERLINED_CODE3.sub(r'`_\1_`', line)
-
-            # code snippet
-            line = RE_CODE_SNIPPET.sub(inline_code_snippet, line)
-
-            line = RE_SUPERSCRIPT1.sub(r'<sup>\1</sup>', line)  # superscript ^abc^
-            line = RE_SUBSCRIPT1.sub(r'<sub>\1</sub>', line)  # subscript ,,abc,,
-
-            line = RE_QUERY1.sub(r'[%s?' % trac_url_query, line) # preconversion to URL format
-            line = RE_HTTPS1.sub(conv_help.wiki_link, line)
-            line = RE_HTTPS2.sub(conv_help.wiki_link, line)  # link without display text
-            line = RE_HTTPS3.sub(conv_help.wiki_link, line)
-            line = RE_HTTPS4.sub(conv_help.wiki_link, line)
-
-            line = RE_IMAGE1.sub(conv_help.image_link_under_tree, line)
-            line = RE_IMAGE2.sub(conv_help.image_link, line)
-            line = RE_IMAGE3.sub(conv_help.image_link, line)
-            line = RE_IMAGE4.sub(r'<img src="\1" \2>', line)
-            line = RE_IMAGE5.sub(conv_help.wiki_image, line)  # \2 is image width
-            line = RE_IMAGE6.sub(conv_help.image_link, line)  # \2 is image width, \3 is alignment
-
-            line = RE_TICKET_COMMENT1.sub(conv_help.ticket_comment_link, line)
-            line = RE_TICKET_COMMENT2.sub(conv_help.ticket_comment_link, line)
-            line = RE_TICKET_COMMENT3.sub(conv_help.ticket_comment_link, line)
-            line = RE_TICKET_COMMENT4.sub(conv_help.ticket_comment_link, line)
-            line = RE_TICKET_COMMENT5.sub(conv_help.ticket_comment_link, line)
-            line = RE_TICKET_COMMENT6.sub(conv_help.ticket_comment_link, line)
-
-            line = RE_COMMENT1.sub(conv_help.comment_link, line)
-            line = RE_COMMENT2.sub(conv_help.comment_link, line)
-            line = RE_COMMENT3.sub(conv_help.comment_link, line)
-            line = RE_COMMENT4.sub(conv_help.comment_link, line)
-
-            line = RE_ATTACHMENT1.sub(conv_help.attachment, line)
-            line = RE_ATTACHMENT2.sub(conv_help.attachment, line)
-            line = RE_ATTACHMENT3.sub(conv_help.attachment, line)
-            line = RE_ATTACHMENT4.sub(conv_help.attachment, line)
-            line = RE_ATTACHMENT5.sub(conv_help.attachment, line)
-            line = RE_ATTACHMENT6.sub(conv_help.attachment, line)
-            line = RE_ATTACHMENT7.sub(conv_help.attachment, line)
-            line = RE_ATTACHMENT8.sub(conv_help.attachment, line)
+class ConversionTimeout(Exception):
+    pass
 
-            if in_table:
-                line = RE_LINEBREAK1.sub('<br>', line)
-                line = RE_LINEBREAK2.sub('<br>', line)
+class ConversionTimer:
+    """
+    Time spent by a conversion in each of its steps.
+    """
+    def step(self, name):
+        """
+        Start the step of the given name.
+        """
+        now = perf_counter()
+        self.times[self.name] += now - self._start
+        self.name = name
+        self._start = now
+
+    def slowest_step(self):
+        self.step(None)
+        return max(self.times.items(), key=lambda x: x[1])[0]
+
+    def __init__(self):
+        self.times = defaultdict(float)
+        self.name = 'setup'
+        self._start = perf_counter()
+
+# timer of the running conversion if conversion_time_limit or
+# slowest_conversions is set
+conversion_timer = None
+# the slowest conversions as a heap of (seconds, item, step)
+conversion_timings = []
+
+def conversion_step(name):
+    """
+    Mark the start of a step of the running conversion.
+    """
+    if conversion_timer is not None:
+        conversion_timer.step(name)
+
+def conversion_item(text, conv_help):
+    """
+    Return a short description of the converted text for the reports.
+    """
+    ticket_id = getattr(conv_help, '_ticket_id', None)
+    if ticket_id is not None:
+        item = 'ticket #%s' % ticket_id
+    else:
+        item = getattr(conv_help, '_trac_wiki_path', None) or type(conv_help).__name__
+    return '%s: %s' % (item, text[:40].replace('\n', ' '))
+
+def literal_markdown(text):
+    """
+    Return Markdown showing the text as it is.
+    """
+    ticks = max([len(t) for t in re.findall('`+', text)] + [2])
+    return '%s\n%s\n%s' % ('`' * (ticks + 1), text, '`' * (ticks + 1))
+
+def guarded_conversion(convert):
+    """
+    Decorator limiting the time of ``trac2markdown`` and timing its steps.
+
+    If the conversion takes longer than ``conversion_time_limit`` seconds, as
+    it may on pathological input for some regular expressions, it is
+    interrupted by raising ``ConversionTimeout``, see ``cached_conversion``.
+    """
+    @functools.wraps(convert)
+    def wrapper(text, base_path, conv_help, multilines=default_multilines):
+        global conversion_timer
+        if (not conversion_time_limit and not slowest_conversions) or conversion_timer is not None:
+            return convert(text, base_path, conv_help, multilines)
+
+        def timeout(signum, frame):
+            raise ConversionTimeout
+
+        start = perf_counter()
+        conversion_timer = timer = ConversionTimer()
+        limit = conversion_time_limit and hasattr(signal, 'setitimer')
+        if limit:
+            handler = signal.signal(signal.SIGALRM, timeout)
+            signal.setitimer(signal.ITIMER_REAL, conversion_time_limit)
+        try:
+            return convert(text, base_path, conv_help, multilines)
+        except ConversionTimeout:
+            # logged by cached_conversion, also for the conversions in the
+            # worker processes, whose logging is disabled
+            raise ConversionTimeout('Conversion of %s interrupted after %s seconds in step %s'
+                                    % (conversion_item(text, conv_help), conversion_time_limit, timer.name))
+        finally:
+            if limit:
+                signal.setitimer(signal.ITIMER_REAL, 0)
+                signal.signal(signal.SIGALRM, handler)
+            conversion_timer = None
+            if slowest_conversions:
+                timing = (perf_counter() - start, conversion_item(text, conv_help), timer.slowest_step())
+                if len(conversion_timings) < slowest_conversions:
+                    heapq.heappush(conversion_timings, timing)
+                else:
+                    heapq.heappushpop(conversion_timings, timing)
+
+    return wrapper
+
+def guarded_conversion_lines(lines, text, conv_help):
+    """
+    Generator limiting the time taken by ``trac2markdown_lines`` to produce
+    each of the pieces ``lines`` of the conversion of ``text``.
+
+    If a piece takes longer than ``conversion_time_limit`` seconds,
+    ``ConversionTimeout`` is raised, as by ``guarded_conversion``.
+    """
+    global conversion_timer
+    if not conversion_time_limit or not hasattr(signal, 'setitimer') or conversion_timer is not None:
+        yield from lines
+        return
+
+    def timeout(signum, frame):
+        raise ConversionTimeout
+
+    conversion_timer = timer = ConversionTimer()
+    try:
+        while True:
+            handler = signal.signal(signal.SIGALRM, timeout)
+            signal.setitimer(signal.ITIMER_REAL, conversion_time_limit)
+            try:
+                piece = next(lines)
+            except StopIteration:
+                return
+            except ConversionTimeout:
+                raise ConversionTimeout('Conversion of %s interrupted after %s seconds for a piece in step %s'
+                                        % (conversion_item(text, conv_help), conversion_time_limit, timer.name))
+            finally:
+                signal.setitimer(signal.ITIMER_REAL, 0)
+                signal.signal(signal.SIGALRM, handler)
+            # the piece is written out without the time limit
+            yield piece
+    finally:
+        conversion_timer = None
+
+# side effects of the running conversion, see cached_conversion
+conversion_effects = None
+conversion_cache_statistics = defaultdict(lambda: 0)
+
+def conversion_key(text, base_path, multilines, context):
+    """
+    Return the key of the conversion in the conversion cache.
+    """
+    return sha256(repr((text, base_path, multilines, context)).encode()).hexdigest()
+
+def record_conversion(convert, text, base_path, conv_help, multilines):
+    """
+    Return the converted text together with the side effects of the conversion.
+    """
+    global conversion_effects
+    conversion_effects = []
+    try:
+        converted = convert(text, base_path, conv_help, multilines)
+        return converted, conversion_effects
+    finally:
+        conversion_effects = None
+
+def replay_conversion_effects(effects):
+    """
+    Perform the side effects of a conversion done before.
+
+    Return ``False`` without performing them if the usernames are now
+    converted differently.
+    """
+    if not all(map_trac_username(*args)[0] == result
+               for kind, args, result in effects if kind == 'username'):
+        return False
+    for kind, args, result in effects:
+        if kind == 'username':
+            convert_trac_username(*args)
+        elif kind == 'attachment':
+            gh_create_attachment(dest, None, *args, None)
+    return True
+
+def cached_conversion(convert):
+    """
+    Decorator storing the results of ``trac2markdown`` in the conversion cache
+    and the conversion memo.
+
+    The key covers the text, the base path, the multilines flag and the
+    context of the conversion helper. The conversion of usernames and
+    attachment links has side effects, and the usernames depend on the user
+    mapping and the GitHub users known so far. These effects are stored with
+    the result. When the result is taken from the cache, the memo or the
+    conversion pool, the usernames are checked against the current mapping
+    and the effects are performed again.
+
+    A conversion interrupted by ``ConversionTimeout`` is rendered literally.
+    This result and its effects are neither cached nor memoized, so that
+    the text is converted again by the next run.
+    """
+    @functools.wraps(convert)
+    def wrapper(text, base_path, conv_help, multilines=default_multilines):
+        try:
+            return cached(text, base_path, conv_help, multilines)
+        except ConversionTimeout as e:
+            log.warning('%s; it is rendered literally' % e)
+            conversion_cache_statistics['timeouts'] += 1
+            return literal_markdown(text)
+
+    def cached(text, base_path, conv_help, multilines):
+        if ((conversion_cache is None and conversion_pool is None and conversion_memo is None)
+            or conversion_effects is not None
+            or (create_wiki_link_conversion_table and not isinstance(conv_help, IssuesConversionHelper))):
+            # the headings of wiki pages are written to the wiki path conversion table
+            return convert(text, base_path, conv_help, multilines)
+
+        key = conversion_key(text, base_path, multilines, conv_help.cache_context())
+        if conversion_memo is not None and key in conversion_memo:
+            converted, effects = conversion_memo[key]
+            if replay_conversion_effects(effects):
+                return converted
+        if conversion_cache is not None:
+            entry = conversion_cache.get(key)
+            if entry is not None:
+                converted, effects = entry
+                if replay_conversion_effects(effects):
+                    conversion_cache_statistics['hits'] += 1
+                    if conversion_memo is not None:
+                        conversion_memo[key] = entry
+                    return converted
+
+        entry = None
+        if conversion_pool is not None:
+            entry = conversion_pool.result(key)
+            if entry is not None and replay_conversion_effects(entry[1]):
+                conversion_cache_statistics['parallel'] += 1
             else:
-                line = RE_LINEBREAK1.sub('\n', line)
-                line = RE_LINEBREAK2.sub('\n', line)
+                entry = None
+        if entry is None:
+            conversion_cache_statistics['misses'] += 1
+            entry = record_conversion(convert, text, base_path, conv_help, multilines)
+        if conversion_cache is not None:
+            conversion_cache[key] = entry
+        if conversion_memo is not None:
+            conversion_memo[key] = entry
+        return entry[0]
+
+    return wrapper
+
+# results of the conversions of the current ticket, by key; the versions of
+# the description are converted only once when its changes are diffed
+conversion_memo = None
+
+# the conversion helper of a worker process of the ConversionPool, and the
+# barrier at which its workers wait for each other when the pool is started
+conversion_helper = None
+conversion_barrier = None
+
+def init_conversion_worker(conv_help, barrier):
+    global conversion_helper, conversion_barrier
+    conversion_helper = conv_help
+    conversion_barrier = barrier
+    # the side effects are logged when they are performed again
+    logging.disable()
+
+def wait_for_conversion_workers():
+    conversion_barrier.wait(60)
+
+def convert_in_worker(text, base_path, multilines, ticket_id):
+    conversion_helper.set_ticket_paths(ticket_id)
+    return record_conversion(trac2markdown.__wrapped__, text, base_path, conversion_helper, multilines)
+
+class ConversionPool:
+    """
+    Pool of worker processes converting the texts of upcoming tickets.
 
-            line = RE_WIKI4.sub(conv_help.wiki_link, line)  # for pagenames containing whitespaces
-            line = RE_WIKI5.sub(conv_help.wiki_link, line)
-            line = RE_WIKI6.sub(conv_help.wiki_link, line)  # link without display text
-            line = RE_WIKI7.sub(conv_help.wiki_link, line)
+    The results are collected by ``trac2markdown`` when the main loop comes
+    to the texts, so that the output stays in the order of the tickets.
+    """
+    def __init__(self, processes, conv_help):
+        self._conv_help = copy(conv_help)
+        # forked workers inherit the configuration and the helper, which
+        # holds the connection to Trac and cannot be pickled
+        context = multiprocessing.get_context('fork')
+        self._executor = ProcessPoolExecutor(processes, mp_context=context,
+                                             initializer=init_conversion_worker,
+                                             initargs=(self._conv_help, context.Barrier(processes)))
+        self._futures = {}  # key -> future
+        self._tickets = {}  # ticket id -> keys
+        # fork all workers now, before the threads of the TracPrefetcher are
+        # started, as forking with running threads may deadlock: no worker is
+        # idle until all wait at the barrier, so each of these tasks forks one
+        waiting = [self._executor.submit(wait_for_conversion_workers) for i in range(processes)]
+        for future in waiting:
+            future.result()
+
+    def submit(self, src_ticket_id, texts, base_path='/issues/', multilines=False):
+        """
+        Submit the conversion of the texts of a ticket.
+        """
+        if src_ticket_id in self._tickets:
+            return
+        self._conv_help.set_ticket_paths(src_ticket_id)
+        context = self._conv_help.cache_context()
+        keys = []
+        for text in texts:
+            key = conversion_key(text, base_path, multilines, context)
+            if key in self._futures or (conversion_cache is not None and key in conversion_cache):
+                continue
+            self._futures[key] = self._executor.submit(convert_in_worker, text, base_path,
+                                                       multilines, src_ticket_id)
+            keys.append(key)
+        self._tickets[src_ticket_id] = keys
 
-            line = RE_SOURCE1.sub(r'[\2](%s/\1)' % os.path.relpath('/tree/master/', base_path), line)
-            line = RE_SOURCE2.sub(r'[\1](%s/\1)' % os.path.relpath('/tree/master/', base_path), line)
+    def result(self, key):
+        """
+        Return the converted text and its side effects, or ``None`` if the
+        conversion was not submitted.
+        """
+        future = self._futures.pop(key, None)
+        if future is None:
+            return None
+        return future.result()
 
-            line = RE_BOLDTEXT1.sub(r'**\1**', line)
-            line = RE_ITALIC1.sub(r'*\1*', line)
-            line = RE_ITALIC2.sub(r'*\1*', line)
+    def done(self, src_ticket_id):
+        """
+        Discard the conversions of a ticket that were not collected.
+        """
+        for key in self._tickets.pop(src_ticket_id, []):
+            future = self._futures.pop(key, None)
+            if future is not None:
+                future.cancel()
+
+    def shutdown(self):
+        self._executor.shutdown(cancel_futures=True)
+
+conversion_pool = None
+
+@cached_conversion
+@guarded_conversion
+def trac2markdown(text, base_path, conv_help, multilines=default_multilines):
+    return '\n'.join(trac2markdown_lines(text, base_path, conv_help, multilines))
+
+def trac2markdown_lines(text, base_path, conv_help, multilines=default_multilines):
+    """
+    Generator of the conversion of ``text`` to Markdown in pieces of whole
+    lines, which joined by line breaks give the result of ``trac2markdown``.
+
+    The text is parsed as a whole, since the indentation of a block is only
+    known when it is closed, but the lines are rendered and rewritten one at
+    a time, so that large wiki pages can be written out while they are
+    converted. Unlike ``trac2markdown``, this neither caches nor limits
+    the time of the conversion.
+    """
+    return rewrite_markdown_lines(render_trac_lines(text, base_path, conv_help, multilines))
+
+def render_trac_lines(text, base_path, conv_help, multilines):
+    """
+    Generator of the lines of the conversion of ``text`` before the final
+    rewritings, see ``rewrite_markdown_lines``.
+
+    Only the blocks are parsed into a tree, by ``parse_trac_blocks``. The
+    lines are rendered into a buffer that is patched when a badly indented
+    block is closed (see ``TracBlock``), as trac2markdown did before the
+    parse, so that the output is byte-for-byte the same.
+    """
+    # conversion of url
+    text = trac_url_conv_help.sub(text)
+    text = cgit_conv_help.sub(text)
+
+    # some normalization
+    text = RE_WRONG_FORMAT1.sub(r'ticket:\2#comment:\1', text)
+    text = RE_REPLYING_TO.sub(convert_replying_to, text)
+    text = RE_REPLYING_TO_TICKET.sub(convert_replying_to_ticket, text)
+
+    text = re.sub('\r\n', '\n', text)
+    text = re.sub(r'\swiki:([a-zA-Z]+)', r' [wiki:\1]', text)
+
+    text = re.sub(r'\[\[TOC[^]]*\]\]', '', text)
+    text = re.sub(r'(?m)\[\[PageOutline\]\]\s*\n', '', text)
 
-            line = RE_TICKET1.sub(r' #\1', line) # replace global ticket references
-            line = RE_TICKET2.sub(conv_help.ticket_link, line)
+    if multilines:
+        conversion_step('multilines')
+        text = re.sub(r'^\S[^\n]+([^=-_|])\n([^\s`*0-9#=->-_|])', r'\1 \2', text)
 
-            # to avoid unintended github mention
-            line = RE_GITHUB_MENTION1.sub(github_mention, line)
-            line = RE_GITHUB_MENTION2.sub(github_mention, line)
+    def heading_replace(match):
+        """
+        Return the replacement for the heading
+        """
+        level = len(match.group(1))
+        heading = match.group(2).rstrip()
+
+        if not isinstance(conv_help, IssuesConversionHelper) and create_wiki_link_conversion_table:
+            with open('wiki_path_conversion_table.txt', "a") as f:
+                f.write(conv_help._trac_wiki_path + '#' + heading.replace(' ', '') + ' '
+                        + conv_help._wiki_path + '#' + heading.replace(' ', '-'))
+                f.write('\n')
+
+        # There might be a second item if an anchor is set.
+        # We ignore this anchor since it is automatically
+        # set it GitHub Markdown.
+        return '#'*level + ' ' + heading
+
+    replacements = inline_replacements(conv_help, base_path, heading_replace)
+    replacements = {False: replacements, True: table_inline_replacements(replacements)}
+
+    def camelcase(part):
+        part = RE_CAMELCASE1.sub(conv_help.camelcase_wiki_link, part)
+        return RE_CAMELCASE2.sub(conv_help.camelcase_wiki_link, part)
+
+    def linebreaks_and_wiki_links(linebreak):
+        def convert(part):
+            if '\\\\' in part:
+                part = RE_LINEBREAK3.sub(linebreak, part)
+            if '[[' in part:
+                part = RE_WIKI1.sub(conv_help.wiki_link, part)
+                part = RE_WIKI2.sub(conv_help.wiki_link, part)
+                part = RE_WIKI3.sub(conv_help.wiki_link, part)
+            return part
+        return convert
+
+    linebreaks_and_wiki_links = {False: linebreaks_and_wiki_links('\n'),
+                                 True: linebreaks_and_wiki_links('<br>')}
+
+    conversion_step('blocks')
+    document = parse_trac_blocks(text)
+
+    # the rendered lines not yet yielded: the last ones may still be indented
+    # when a block is closed, and the very last one is dropped
+    output = deque()
+    emitted = False
+    in_list = False
+    block = []
+    table = []
+    list_indents = []
+    previous_line = ''
+    for node, closed in document.lines():
+        while len(output) > document.lookback + 1:
+            yield output.popleft()
+            emitted = True
+
+        quote_prefix = node.quote_prefix
+        if node.quote_break:
+            output.append(quote_prefix)
+            continue
+
+        if closed and closed.defect > 0:
+            # adjust badly indented codeblocks
+            for i in range(1, min(closed.n, len(output)) + 1):
+                prev_line = output[-i]
+                output[-i] = prev_line[:len(quote_prefix)] + closed.defect*' ' + prev_line[len(quote_prefix):]
+
+        line = node.text
+        in_code = node.in_code
+        in_html = node.in_html
+        in_td = node.in_td
+        table_role = node.table_role
+        in_table = table_role not in (None, 'continued_header') and not node.table_header
+
+        if previous_line:
+            line = previous_line + line
+            previous_line = ''
+
+        # CamelCase wiki link
+        if not (in_code or in_html or in_td):
+            conversion_step('camelcase')
+            line = convert_outside_brackets(line, camelcase)
+
+        if not (in_code or in_html):
+            line = convert_inline(line, replacements[in_table])
+            conversion_step('tables_and_lists')
 
             if RE_RULE.match(line):
-                if not a or not a[-1].strip():
+                if not output or not output[-1].strip():
                     line = '---'
                 else:
                     line = '\n---'
@@ -1037,42 +2460,14 @@ def trac2markdown(text, base_path, conv_help, multilines=default_multilines):
             line = RE_NO_CAMELCASE.sub(r'\1', line)  # no CamelCase wiki link because of leading "!"
 
             # convert a trac table to a github table
-            if line.startswith('||'):
-                if not in_table:  # header row
-                    if line.endswith('||\\'):
-                        previous_line = line[:-3]
-                        continue
-                    elif line.endswith('|| \\'):
-                        previous_line = line[:-4]
-                        continue
-                    # construct header separator
-                    parts = line.split('||')
-                    sep = []
-                    for part in parts:
-                        if part.startswith('='):
-                            part = part[1:]
-                            start = ':'
-                        else:
-                            start = ''
-                        if part.endswith('='):
-                            part = part[:-1]
-                            end = ':'
-                        else:
-                            end = ''
-                        sep.append(start + '-'*len(part) + end)
-                    sep = '||'.join(sep)
-                    if ':' in sep:
-                        line = line + '\n' + sep
-                    else:  # perhaps a table without header; github table needs header
-                        header = re.sub(r'[^|]', ' ', sep)
-                        line = header + '\n' + sep + '\n' + line
-                    in_table = True
-                # The wiki markup allows the alignment directives to be specified on a cell-by-cell
-                # basis. This is used in many examples. AFAIK this can't be properly translated into
-                # the GitHub markdown as it only allows to align statements column by column.
-                line = line.replace('||=', '||')  # ignore cellwise align instructions
-                line = line.replace('=||', '||')  # ignore cellwise align instructions
-                line = line.replace('||', '|')
+            if table_role == 'continued_header':
+                previous_line = line[:-3] if line.endswith('||\\') else line[:-4]
+                continue
+            if node.table_header:
+                line = table_header_row(line)
+                in_table = True
+            if line.startswith('||'):
+                line = table_row(line)
 
             # lists
             if in_list:
@@ -1137,63 +2532,38 @@ def trac2markdown(text, base_path, conv_help, multilines=default_multilines):
                     line = line.replace('i', toRoman(c).lower(), 1)
 
             # take care of line break "\\", which often occurs in code snippets
-            l = len(line)
-            new_line = ''
-            start = 0
-            inline_code = False
-            for i in range(l + 1):
-                if i == l or line[i] == '`':
-                    end = i
-                    part = line[start:end]
-                    if not inline_code:
-                        if in_table:
-                            part = RE_LINEBREAK3.sub('<br>', part)
-                        else:
-                            part = RE_LINEBREAK3.sub('\n', part)
-
-                        part = RE_WIKI1.sub(conv_help.wiki_link, part)
-                        part = RE_WIKI2.sub(conv_help.wiki_link, part)
-                        part = RE_WIKI3.sub(conv_help.wiki_link, part)
-
-                    new_line += part
-                    start = end
-                    if i < l and line[i] == '`':
-                        if not inline_code:
-                            inline_code = True
-                        else:
-                            inline_code = False
-            line = new_line
+            conversion_step('linebreaks_and_wiki_links')
+            line = convert_outside_code(line, linebreaks_and_wiki_links[in_table])
 
         # only for table with td blocks:
-        if in_table:
-            if line == '|\\' or line == '| \\':  # leads td block
-                block = []
-                continue
-            if line == '|':
-                table.append('|' + 'NEW__LINE'.join(block) +'|')
-                block = []
-                continue
-            if line.startswith(proc_td.open):
-                if len(block) > 1:
-                    block.append('|')
-                block.append(line)
-                continue
-            if in_td:
-                line = re.sub('\n', 'NEW__LINE', line)
-                block.append(line)
-                continue
-            if line.startswith(proc_td.close):
-                block.append(line)
-                continue
-            if line.startswith('|'):
-                if line.endswith('|\\'):
-                    previous_line = line[:-2].replace('|', '||')  # restore to trac table row
-                elif line.endswith('| \\'):
-                    previous_line = line[:-3].replace('|', '||')  # restore to trac table row
-                else:
-                    table.append(line)
-                continue
-
+        if table_role == 'lead':
+            block = []
+            continue
+        elif table_role == 'end':
+            table.append('|' + 'NEW__LINE'.join(block) +'|')
+            block = []
+            continue
+        elif table_role == 'td_open':
+            if len(block) > 1:
+                block.append('|')
+            block.append(line)
+            continue
+        elif table_role == 'td_line':
+            block.append(line.replace('\n', 'NEW__LINE'))
+            continue
+        elif table_role == 'td_close':
+            block.append(line)
+            continue
+        elif table_role == 'row':
+            table.append(line)
+            continue
+        elif table_role == 'continued_row':
+            if line.endswith('|\\'):
+                previous_line = line[:-2].replace('|', '||')  # restore to trac table row
+            else:
+                previous_line = line[:-3].replace('|', '||')  # restore to trac table row
+            continue
+        elif table_role == 'following':
             if block:  # td block may not be terminated by "|" (or trac "||")
                 table.append('|' + 'NEW__LINE'.join(block) +'|')
                 block = []
@@ -1201,36 +2571,63 @@ def trac2markdown(text, base_path, conv_help, multilines=default_multilines):
             if table:
                 table_text = '\n'.join(table)
                 if proc_td.open in table_text:
-                    html = markdown.markdown(table_text, extensions=[TableExtension(use_align_attribute=True)])
-                    html = proc_td.replace(html)
+                    conversion_step('td_table')
+                    if use_python_markdown:
+                        table_html = markdown.markdown(table_text, extensions=[TableExtension(use_align_attribute=True)])
+                    else:
+                        table_html = markdown_table_html(table_text.split('\n'))
+                    table_html = proc_td.replace(table_html)
                 else:
-                    html = table_text
-                line = html.replace('NEW__LINE', '\n') + '\n' + line
+                    table_html = table_text
+                line = table_html.replace('NEW__LINE', '\n') + '\n' + line
                 table = []
 
-            in_table = False
-
         for l in line.split('\n'):
-            a.append(quote_prefix + l)
+            output.append(quote_prefix + l)
 
-    a = a[:-1]
-    text = '\n'.join(a)
+    if output:
+        output.pop()
+    while output:
+        yield output.popleft()
+        emitted = True
 
     # close unclosed codeblock
-    if in_code or in_html:
-        text += '\n%s' % proc_code.close
+    if document.unclosed:
+        if not emitted:
+            yield ''
+        yield proc_code.close
+
+# wiki pages with more characters are written out while they are converted,
+# with the time limit applied to each piece (see guarded_conversion_lines),
+# and are not stored in the conversion cache
+streaming_page_size = 1000000
 
-    # remove artifacts
+# number of lines rewritten at once by rewrite_markdown_lines
+rewrite_chunk_lines = 100
+
+RE_REPORT_OPEN = re.compile(r'\[report:[0-9]+\s*$')
+
+def remove_artifacts(text):
+    """
+    Return the text with the protection tags of the conversion replaced.
+    """
     text = proc_code.replace(text)
     text = link_displ.replace(text)
     text = at_sign.replace(text)
     text = linebreak_sign1.replace(text)
     text = linebreak_sign2.replace(text)
     text = linebreak_sign3.replace(text)
+    return text
 
-    # Some rewritings
+def rewrite_markdown(text):
+    """
+    Return the text with some rewritings applied.
+    """
+    conversion_step('color')
     text = RE_COLOR.sub(r'$\\textcolor{\1}{\\text{\2}}$', text)
+    conversion_step('trac_report')
     text = RE_TRAC_REPORT.sub(r'[Trac report of id \1](%s/\1)' % trac_url_report, text)
+    conversion_step('new_commits')
     text = RE_NEW_COMMITS.sub(commits_list, text)
     text = RE_LAST_NEW_COMMITS.sub(commits_list, text)
 
@@ -1238,6 +2635,31 @@ def trac2markdown(text, base_path, conv_help, multilines=default_multilines):
 
     return text
 
+def rewrite_markdown_lines(lines):
+    """
+    Generator applying ``remove_artifacts`` and ``rewrite_markdown`` to the
+    given lines.
+
+    The lines are rewritten in chunks of at least ``rewrite_chunk_lines``
+    lines, which end with a blank line that is not within a report link
+    broken after its id. No rewriting matches across such a line, so that
+    the chunks are rewritten as in the joined text.
+    """
+    chunk = None
+    report_open = False
+    for line in lines:
+        line = remove_artifacts(line)
+        if chunk is None:
+            chunk = [line]
+        elif len(chunk) < rewrite_chunk_lines or report_open or chunk[-1].strip():
+            chunk.append(line)
+        else:
+            yield rewrite_markdown('\n'.join(chunk))
+            chunk = [line]
+        report_open = bool(RE_REPORT_OPEN.search(line)) or (report_open and not line.strip())
+    if chunk is not None:
+        yield rewrite_markdown('\n'.join(chunk))
+
 def escape(text):
     text = text.replace('comment:', 'COMMENT__COLON')
     return text
@@ -1255,7 +2677,7 @@ class WikiConversionHelper:
         """
         The Python constructor collects all the necessary information.
         """
-        pagenames = source.wiki.getAllPages()
+        pagenames = get_wiki_pagenames(source)
         pagenames_splitted = []
         for p in pagenames:
             pagenames_splitted += p.split('/')
@@ -1263,6 +2685,7 @@ class WikiConversionHelper:
 
         self._pagenames_splitted = pagenames_splitted
         self._pagenames_not_splitted = pagenames_not_splitted
+        self._pagenames_digest = sha256(repr(pagenames).encode()).hexdigest()
         self._attachment_path = ''
 
     def set_wikipage_paths(self, pagename):
@@ -1279,6 +2702,13 @@ class WikiConversionHelper:
                 f.write(self._trac_wiki_path + ' ' + self._wiki_path)
                 f.write('\n')
 
+    def cache_context(self):
+        """
+        Return the data the conversions depend on besides the converted text.
+        """
+        return (type(self).__name__, self._pagenames_digest, self._attachment_path,
+                getattr(self, '_trac_wiki_path', None), getattr(self, '_wiki_path', None))
+
     def attachment(self, match):
         filename = match.group(1)
         if len(match.groups()) >= 2:
@@ -1450,6 +2880,12 @@ class IssuesConversionHelper(WikiConversionHelper):
         """
         self._ticket_id = ticket_id
 
+    def cache_context(self):
+        """
+        Return the data the conversions depend on besides the converted text.
+        """
+        return super().cache_context() + (getattr(self, '_ticket_id', None),)
+
     def attachment(self, match):
         filename = match.group(1)
         if len(match.groups()) >= 2:
@@ -1460,6 +2896,8 @@ class IssuesConversionHelper(WikiConversionHelper):
         if keep_trac_ticket_references:
             url = '%s/ticket/%s/%s' % (trac_url_attachment, str(self._ticket_id), filename)
         else:
+            if conversion_effects is not None:
+                conversion_effects.append(('attachment', (filename, self._ticket_id), None))
             a, _, _ = gh_create_attachment(dest, None, filename, self._ticket_id, None)
             if a.url.endswith('.gz'):
                 filename += '.gz'
@@ -1852,7 +3290,7 @@ def gh_create_attachment(dest, issue, filename, src_ticket_id, attachment=None,
                     # Here we are stricter than what mime_type_allowed_extensions allows.
                     # Replace by a gzipped file
                     if attachment:
-                        attachment['attachment'] = gzip.compress(attachment['attachment'])
+                        attachment['gzip'] = True
                     filename += ".gz"
                     mimetype = 'application/gzip'
                     logging.info(f'Replaced by {filename=} {mimetype=}')
@@ -1903,6 +3341,32 @@ def gh_create_attachment(dest, issue, filename, src_ticket_id, attachment=None,
         note = 'Attachment'
     return a, local_filename, note
 
+def write_attachment(local_filename, attachment):
+    """
+    Write the attachment to the file, gzipped if ``gh_create_attachment``
+    asks for it. An attachment from the mirror is linked, or copied if it
+    cannot be linked, without reading it into memory.
+
+    The existing file is removed first, as it may be a link to the mirror,
+    which writing to it would alter.
+    """
+    if os.path.lexists(local_filename):
+        os.remove(local_filename)
+    if 'attachment_file' not in attachment:
+        data = attachment['attachment']
+        if attachment.get('gzip'):
+            data = gzip.compress(data)
+        open(local_filename, 'wb').write(data)
+    elif attachment.get('gzip'):
+        with open(attachment['attachment_file'], 'rb') as f, open(local_filename, 'wb') as g:
+            with gzip.GzipFile(filename='', mode='wb', fileobj=g) as z:
+                shutil.copyfileobj(f, z)
+    else:
+        try:
+            os.link(attachment['attachment_file'], local_filename)
+        except OSError:
+            shutil.copyfile(attachment['attachment_file'], local_filename)
+
 minimized_issue_comments = []
 local_filenames = dict()  # local_filename -> comment_id
 def gh_comment_issue(dest, issue, comment, src_ticket_id, comment_id=None, minimize=True):
@@ -1917,7 +3381,7 @@ def gh_comment_issue(dest, issue, comment, src_ticket_id, comment_id=None, minim
             logging.warning(f'Overwriting attachment {local_filename} with a new version')
         else:
             local_filenames[local_filename] = comment_id
-        open(local_filename, 'wb').write(attachment['attachment'])
+        write_attachment(local_filename, attachment)
         if preamble:
             preamble += '\n\n'
         preamble += note
@@ -2031,22 +3495,26 @@ def gh_update_issue_property(dest, issue, key, val, oldval=None, **kwds):
 
 unmapped_users = defaultdict(lambda: 0)
 
-def convert_trac_username(origname, is_mention=False):
+def map_trac_username(origname, is_mention=False):
+    """
+    Return the GitHub username for the Trac username and the key of the
+    unmapped user if a mannequin user is used.
+    """
     if origname in ignored_values:
-        return None
+        return None, None
     if is_mention and origname in ignored_mentions:
-        return None
+        return None, None
     if origname in ignored_names:
-        return None
+        return None, None
     origname = origname.strip('\u200b').rstrip('.')
     if origname.startswith('gh-'):
-        return origname[3:]
+        return origname[3:], None
     if origname.startswith('github/'):
         # example: https://trac.sagemath.org/ticket/17999
-        return origname[7:]
+        return origname[7:], None
     if origname.startswith('gh:'):
         # example: https://trac.sagemath.org/ticket/24876
-        return origname[3:]
+        return origname[3:], None
     try:
         gh_name = users_map[origname]
     except KeyError:
@@ -2056,23 +3524,30 @@ def convert_trac_username(origname, is_mention=False):
             # heuristic pattern for valid Trac account name (not an email address or full name or junk)
             pass
         else:
-            return None
+            return None, None
         gh_name = False
     else:
         if gh_name:
-            return gh_name
+            return gh_name, None
     # create mannequin user
     username = origname.replace('.', '-').replace('_', '-').strip('-')
     username = f'{unknown_users_prefix}{username}'
     if is_mention and not username in gh_users:
-        return None
-    key = (origname, gh_name is not False, is_mention, '@' + username)
-    if not unmapped_users[key]:
-        if is_mention:
-            logging.info(f'Unmapped @ mention of {origname}')
-        else:
-            logging.info(f'Unmapped Trac user {origname}')
-    unmapped_users[key] += 1
+        return None, None
+    return username, (origname, gh_name is not False, is_mention, '@' + username)
+
+def convert_trac_username(origname, is_mention=False):
+    username, key = map_trac_username(origname, is_mention)
+    if conversion_effects is not None:
+        conversion_effects.append(('username', (origname, is_mention), username))
+    if key:
+        origname = key[0]
+        if not unmapped_users[key]:
+            if is_mention:
+                logging.info(f'Unmapped @ mention of {origname}')
+            else:
+                logging.info(f'Unmapped Trac user {origname}')
+        unmapped_users[key] += 1
     return username
 
 def gh_username(dest, origname):
@@ -2129,50 +3604,1089 @@ def gh_username_list(dest, orignames, ignore=['somebody', 'tbd', 'tdb', 'tba']):
             names.append(name)
     return ', '.join(names)
 
-@cache.memoize(ignore=[0, 'source'])
-def get_all_milestones(source):
-    return source.ticket.milestone.getAll()
+class TokenBucket:
+    """
+    Rate limiter allowing ``rate`` requests per second on average and bursts
+    of up to ``burst`` requests, shared by all threads.
+    """
+    def __init__(self, rate, burst=1):
+        self._rate = rate
+        self._burst = burst
+        self._tokens = burst
+        self._time = monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Wait until the next request is allowed.
+        """
+        if not self._rate:
+            return
+        with self._lock:
+            now = monotonic()
+            self._tokens = min(self._burst, self._tokens + (now - self._time) * self._rate)
+            self._time = now
+            # a waiting request reserves its token
+            self._tokens -= 1
+            wait = -self._tokens / self._rate
+        if wait > 0:
+            sleep(wait)
+
+trac_rate_limiter = TokenBucket(requests_per_second, requests_burst)
+
+class TracTransportMixin:
+    """
+    Mixin for the transports of XML-RPC to Trac.
 
-@cache.memoize(ignore=[0, 'source'])
-def get_milestone(source, milestone_name):
-    return source.ticket.milestone.get(milestone_name)
+    Each request waits for ``trac_rate_limiter``. The connection is opened
+    with the given timeout in seconds and, if ``keep_alive`` is true, kept
+    open for the next request. Compressed responses are accepted if
+    ``gzip`` is true.
+    """
+    def __init__(self, *args, keep_alive=True, gzip=True, timeout=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.keep_alive = keep_alive
+        self.accept_gzip_encoding = gzip
+        self.timeout = timeout
+
+    def make_connection(self, host):
+        connection = super().make_connection(host)
+        # only taken into account when connecting
+        connection.timeout = self.timeout
+        return connection
+
+    def request(self, *args, **kwargs):
+        trac_rate_limiter.acquire()
+        try:
+            return super().request(*args, **kwargs)
+        finally:
+            if not self.keep_alive:
+                self.close()
 
-@cache.memoize(ignore=[0, 'source'])
-def get_changeLog(source, src_ticket_id):
+class TracTransport(TracTransportMixin, client.Transport):
+    pass
+
+class TracSafeTransport(TracTransportMixin, client.SafeTransport):
+    pass
+
+class TracSourceMethod:
+    """
+    Method of ``TracEnvironment`` or ``TracSnapshot``, named like the XML-RPC
+    method of Trac.
+    """
+    def __init__(self, dispatch, name):
+        self._dispatch = dispatch
+        self._name = name
+
+    def __getattr__(self, name):
+        return TracSourceMethod(self._dispatch, self._name + '.' + name)
+
+    def __call__(self, *args):
+        return self._dispatch(self._name, args)
+
+class TracEnvironment:
+    """
+    Source reading the tickets, milestones, wiki pages and attachments from
+    the database and the ``files/attachments`` directory of a copy of a
+    Trac environment, in place of ``client.ServerProxy``.
+
+    The XML-RPC methods used by the migration are answered with the same
+    results as the XML-RPC plugin of Trac (0.12 or later) would give, and
+    a missing ticket, page or attachment raises ``client.Fault``. Of the
+    ticket queries, only the conditions ``field=value`` and ``field!=value``,
+    where the value may start with ``~``, ``^`` or ``$`` and alternatives are
+    separated by ``|``, and ``order``, ``desc``, ``max`` and ``page`` are
+    supported.
+
+    SQLite databases are read with the standard library and PostgreSQL
+    databases with ``psycopg2``, which must be installed. An instance must
+    not be shared by threads.
+    """
+    ticket_columns = ['type', 'time', 'changetime', 'component', 'severity', 'priority',
+                      'owner', 'reporter', 'cc', 'version', 'milestone', 'status',
+                      'resolution', 'summary', 'description', 'keywords']
+
+    def __init__(self, path):
+        self._path = path
+        self._connection = None
+        self._placeholder = '?'
+        self._methods = {
+            'system.multicall': self.multicall,
+            'ticket.query': self.ticket_query,
+            'ticket.get': self.ticket_get,
+            'ticket.changeLog': self.ticket_changelog,
+            'ticket.getAttachment': self.ticket_attachment,
+            'ticket.getRecentChanges': self.ticket_recent_changes,
+            'ticket.milestone.getAll': self.milestone_names,
+            'ticket.milestone.get': self.milestone_get,
+            'wiki.getAllPages': self.wiki_pagenames,
+            'wiki.getPageInfo': self.wiki_page_info,
+            'wiki.getPage': self.wiki_page,
+            'wiki.listAttachments': self.wiki_attachments,
+            'wiki.getAttachment': self.wiki_attachment,
+            'wiki.getRecentChanges': self.wiki_recent_changes,
+        }
+
+    def __getattr__(self, name):
+        return TracSourceMethod(self._dispatch, name)
+
+    def _dispatch(self, method, args):
+        if method not in self._methods:
+            raise client.Fault(1, 'RPC method "%s" not found' % method)
+        return self._methods[method](*args)
+
+    def _execute(self, sql, *args):
+        if self._connection is None:
+            self._connect()
+        cursor = self._connection.cursor()
+        cursor.execute(sql.replace('?', self._placeholder), args)
+        return cursor.fetchall()
+
+    def _connect(self):
+        trac_ini = configparser.ConfigParser(interpolation=None)
+        trac_ini.read(os.path.join(self._path, 'conf', 'trac.ini'))
+        database = trac_ini.get('trac', 'database', fallback='sqlite:db/trac.db')
+        if database.startswith('sqlite:'):
+            import sqlite3
+            self._connection = sqlite3.connect(os.path.join(self._path, database[len('sqlite:'):]))
+        elif database.startswith('postgres:'):
+            import psycopg2
+            url = urlsplit(database)
+            self._connection = psycopg2.connect(host=url.hostname, port=url.port,
+                                                user=url.username and unquote(url.username),
+                                                password=url.password and unquote(url.password),
+                                                dbname=url.path.strip('/'))
+            schema = parse_qs(url.query).get('schema')
+            if schema:
+                self._connection.cursor().execute('SET search_path TO %s', schema)
+            self._placeholder = '%s'
+        else:
+            raise ValueError('Unsupported database of the Trac environment: %s' % database)
+
+    @staticmethod
+    def _datetime(t):
+        """
+        Return the time of Trac, in microseconds since the epoch, as the
+        XML-RPC plugin of Trac does.
+        """
+        return client.DateTime(datetime.fromtimestamp(t / 1e6, timezone.utc).utctimetuple())
+
+    @staticmethod
+    def _timestamp(dt):
+        """
+        Return the time of Trac of an XML-RPC date.
+        """
+        return int(convert_xmlrpc_datetime(dt).replace(tzinfo=timezone.utc).timestamp() * 1e6)
+
+    def _attachment(self, realm, parent_id, filename):
+        """
+        Return the content of the attachment, in the directory layout of
+        Trac 1.0 or of earlier versions.
+        """
+        parent_hash = sha1(parent_id.encode('utf-8')).hexdigest()
+        paths = [os.path.join(self._path, 'files', 'attachments', realm, parent_hash[:3], parent_hash,
+                              sha1(filename.encode('utf-8')).hexdigest() + os.path.splitext(filename)[1]),
+                 os.path.join(self._path, 'attachments', realm, quote(parent_id), quote(filename))]
+        for path in paths:
+            if os.path.isfile(path):
+                with open(path, 'rb') as f:
+                    return client.Binary(f.read())
+        raise client.Fault(404, 'Attachment "%s" of %s %s not found' % (filename, realm, parent_id))
+
+    def multicall(self, calls):
+        results = []
+        for call in calls:
+            try:
+                results.append([self._dispatch(call['methodName'], call['params'])])
+            except client.Fault as e:
+                results.append({'faultCode': e.faultCode, 'faultString': e.faultString})
+        return results
+
+    def ticket_query(self, qstr='status!=closed'):
+        order = 'priority'
+        desc = False
+        limit = 100
+        page = 1
+        conditions = []
+        args = []
+        for term in qstr.split('&'):
+            field, _, value = term.partition('=')
+            if field == 'order':
+                order = value
+            elif field == 'desc':
+                desc = value not in ('', '0')
+            elif field == 'max':
+                limit = int(value)
+            elif field == 'page':
+                page = int(value)
+            elif field:
+                negate = field.endswith('!')
+                field = field.rstrip('!')
+                operator = value[:1] if value[:1] in ('~', '^', '$') else ''
+                if operator:
+                    value = value[1:]
+                column = self._ticket_column(field, args)
+                alternatives = []
+                for value in value.split('|'):
+                    if operator:
+                        value = value.replace('%', r'\%').replace('_', r'\_')
+                        pattern = {'~': '%%%s%%', '^': '%s%%', '$': '%%%s'}[operator]
+                        alternatives.append("COALESCE(%s, '') LIKE ? ESCAPE '\\'" % column)
+                        args.append(pattern % value)
+                    else:
+                        alternatives.append("COALESCE(%s, '') = ?" % column)
+                        args.append(value)
+                condition = '(%s)' % ' OR '.join(alternatives)
+                conditions.append('NOT ' + condition if negate else condition)
+        sql = 'SELECT t.id FROM ticket t'
+        if conditions:
+            sql += ' WHERE ' + ' AND '.join(conditions)
+        sql += ' ORDER BY %s %s, t.id' % (self._ticket_column(order, args), 'DESC' if desc else 'ASC')
+        if limit > 0:
+            sql += ' LIMIT %d OFFSET %d' % (limit, (page - 1) * limit)
+        return [src_ticket_id for src_ticket_id, in self._execute(sql, *args)]
+
+    def _ticket_column(self, field, args):
+        if field == 'id' or field in self.ticket_columns:
+            return 't.' + field
+        args.append(field)
+        return '(SELECT c.value FROM ticket_custom c WHERE c.ticket = t.id AND c.name = ?)'
+
+    def ticket_get(self, src_ticket_id):
+        rows = self._execute('SELECT %s FROM ticket WHERE id = ?' % ', '.join(self.ticket_columns),
+                             src_ticket_id)
+        if not rows:
+            raise client.Fault(404, 'Ticket %s does not exist.' % src_ticket_id)
+        values = {column: value if value is not None else ''
+                  for column, value in zip(self.ticket_columns, rows[0])}
+        for name, value in self._execute('SELECT name, value FROM ticket_custom WHERE ticket = ?',
+                                         src_ticket_id):
+            values[name] = value if value is not None else ''
+        time, changetime = values['time'], values['changetime']
+        values['_ts'] = str(changetime)
+        values['time'] = self._datetime(time)
+        values['changetime'] = self._datetime(changetime)
+        return [src_ticket_id, values['time'], values['changetime'], values]
+
+    def ticket_changelog(self, src_ticket_id):
+        rows = self._execute("""
+            SELECT time, author, field, oldvalue, newvalue, 1 AS permanent
+            FROM ticket_change WHERE ticket = ?
+              UNION
+            SELECT time, author, 'attachment', null, filename, 0 AS permanent
+            FROM attachment WHERE type = 'ticket' AND id = ?
+              UNION
+            SELECT time, author, 'comment', null, description, 0 AS permanent
+            FROM attachment WHERE type = 'ticket' AND id = ?
+            ORDER BY time, permanent, author""", src_ticket_id, str(src_ticket_id), str(src_ticket_id))
+        return [[self._datetime(time), author, field,
+                 oldvalue if oldvalue is not None else '', newvalue if newvalue is not None else '',
+                 permanent]
+                for time, author, field, oldvalue, newvalue, permanent in rows]
+
+    def ticket_attachment(self, src_ticket_id, filename):
+        return self._attachment('ticket', str(src_ticket_id), filename)
+
+    def ticket_recent_changes(self, since):
+        return [src_ticket_id for src_ticket_id, in
+                self._execute('SELECT id FROM ticket WHERE changetime >= ?', self._timestamp(since))]
+
+    def milestone_names(self):
+        rows = self._execute('SELECT name, due, completed FROM milestone')
+        # in the order of Trac
+        rows.sort(key=lambda row: (row[2] or float('inf'), row[1] or float('inf'), row[0]))
+        return [name for name, due, completed in rows]
+
+    def milestone_get(self, name):
+        rows = self._execute('SELECT name, due, completed, description FROM milestone WHERE name = ?',
+                             name)
+        if not rows:
+            raise client.Fault(404, 'Milestone %s does not exist.' % name)
+        name, due, completed, description = rows[0]
+        return {'name': name,
+                'due': self._datetime(due) if due else 0,
+                'completed': self._datetime(completed) if completed else 0,
+                'description': description or ''}
+
+    def wiki_pagenames(self):
+        return [name for name, in self._execute('SELECT DISTINCT name FROM wiki ORDER BY name')]
+
+    def _wiki_version(self, pagename, version):
+        if version is None:
+            rows = self._execute('SELECT name, version, time, author, comment, text FROM wiki '
+                                 'WHERE name = ? ORDER BY version DESC LIMIT 1', pagename)
+        else:
+            rows = self._execute('SELECT name, version, time, author, comment, text FROM wiki '
+                                 'WHERE name = ? AND version = ?', pagename, version)
+        if not rows:
+            raise client.Fault(404, 'Wiki page "%s" does not exist' % pagename)
+        return rows[0]
+
+    def wiki_page_info(self, pagename, version=None):
+        name, version, time, author, comment, text = self._wiki_version(pagename, version)
+        return {'name': name, 'lastModified': self._datetime(time), 'author': author or '',
+                'version': version, 'comment': comment or ''}
+
+    def wiki_page(self, pagename, version=None):
+        return self._wiki_version(pagename, version)[5] or ''
+
+    def wiki_attachments(self, pagename):
+        return ['%s/%s' % (pagename, filename) for filename, in
+                self._execute("SELECT filename FROM attachment WHERE type = 'wiki' AND id = ? "
+                              "ORDER BY time", pagename)]
+
+    def wiki_attachment(self, path):
+        pagename, _, filename = path.rpartition('/')
+        return self._attachment('wiki', pagename, filename)
+
+    def wiki_recent_changes(self, since):
+        rows = self._execute('SELECT name, MAX(version) FROM wiki WHERE time >= ? GROUP BY name',
+                             self._timestamp(since))
+        return [self.wiki_page_info(name, version) for name, version in rows]
+
+snapshot_format = 1
+
+def snapshot_encode(value, add_object):
+    """
+    Return the result of an XML-RPC call of Trac as JSON, with the content of
+    binaries stored by ``add_object``, which returns their hash.
+    """
+    if isinstance(value, client.DateTime):
+        return {'__datetime__': value.value}
+    if isinstance(value, client.Binary):
+        return {'__binary__': add_object(value.data)}
+    if isinstance(value, (list, tuple)):
+        return [snapshot_encode(item, add_object) for item in value]
+    if isinstance(value, dict):
+        return {key: snapshot_encode(item, add_object) for key, item in value.items()}
+    return value
+
+def snapshot_decode(value, read_object):
+    """
+    Inverse of ``snapshot_encode``.
+    """
+    if isinstance(value, list):
+        return [snapshot_decode(item, read_object) for item in value]
+    if isinstance(value, dict):
+        if '__datetime__' in value:
+            return client.DateTime(value['__datetime__'])
+        if '__binary__' in value:
+            return client.Binary(read_object(value['__binary__']))
+        return {key: snapshot_decode(item, read_object) for key, item in value.items()}
+    return value
+
+def snapshot_key(method, params):
+    return method, json.dumps(list(params))
+
+def snapshot_segment_path(directory, segment):
+    return os.path.join(directory, 'segments', '%06d.jsonl.gz' % segment)
+
+def read_snapshot_index(directory):
+    """
+    Return the dictionary of the records of the snapshot by method and
+    parameters, where the last record of a call replaces the earlier ones.
+    """
+    with open(os.path.join(directory, 'manifest.json')) as f:
+        manifest = json.load(f)
+    if manifest.get('format') != snapshot_format:
+        raise ValueError('Unsupported format of the snapshot %s: %s' % (directory, manifest.get('format')))
+    index = {}
+    with open(os.path.join(directory, 'index.jsonl')) as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue  # interrupted while writing the entry
+            index[snapshot_key(entry['method'], entry['params'])] = (entry['segment'], entry['offset'],
+                                                                     entry['length'])
+    return index
+
+class TracSnapshotWriter:
+    """
+    Writer of a snapshot of Trac, which is a directory containing
+    - ``manifest.json``, with the version of the format,
+    - ``segments/*.jsonl.gz``, the results of the XML-RPC calls, one JSON
+      line per call, each compressed as a gzip member of its own,
+    - ``index.jsonl``, the segment, offset and length of each call,
+    - ``objects/``, the binaries, in files named by their SHA-256 hash.
+    Records are only appended, so that an interrupted export resumes with
+    the calls that are not recorded yet.
+    """
+    segment_size = 256 << 20
+
+    def __init__(self, directory):
+        self._directory = directory
+        os.makedirs(os.path.join(directory, 'segments'), exist_ok=True)
+        manifest_path = os.path.join(directory, 'manifest.json')
+        if not os.path.exists(manifest_path):
+            with open(manifest_path, 'w') as f:
+                json.dump({'format': snapshot_format, 'created_at': datetime.now(timezone.utc).isoformat()}, f)
+            open(os.path.join(directory, 'index.jsonl'), 'w').close()
+        self._index = read_snapshot_index(directory)
+        self._segment = max((segment for segment, offset, length in self._index.values()), default=1)
+        self._file = None
+        self._objects = ObjectStore(directory)
+        # replays the calls recorded so far
+        self.reader = TracSnapshot(directory, self._index)
+
+    def __contains__(self, key):
+        return snapshot_key(*key) in self._index
+
+    def add(self, method, params, result=None, fault=None):
+        """
+        Record the result of the call, or its fault.
+        """
+        record = {'method': method, 'params': list(params)}
+        if fault is not None:
+            record['fault'] = [fault.faultCode, fault.faultString]
+        else:
+            record['result'] = snapshot_encode(result, self._objects.add_object)
+        data = gzip.compress(json.dumps(record).encode() + b'\n', mtime=0)
+        if self._file is not None and self._file.tell() + len(data) > self.segment_size:
+            self._file.close()
+            self._file = None
+            self._segment += 1
+        if self._file is None:
+            self._file = open(snapshot_segment_path(self._directory, self._segment), 'ab')
+        offset = self._file.tell()
+        self._file.write(data)
+        self._file.flush()
+        with open(os.path.join(self._directory, 'index.jsonl'), 'a') as f:
+            f.write(json.dumps({'method': method, 'params': list(params), 'segment': self._segment,
+                                'offset': offset, 'length': len(data)}) + '\n')
+        self._index[snapshot_key(method, params)] = self._segment, offset, len(data)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+@functools.lru_cache(maxsize=None)
+def shared_snapshot_index(directory):
+    return read_snapshot_index(directory)
+
+class TracSnapshot:
+    """
+    Source replaying the XML-RPC calls recorded in a snapshot of Trac by
+    ``export_snapshot.py``, in place of ``client.ServerProxy``. A call that
+    is not recorded raises ``client.Fault``. An instance must not be shared
+    by threads.
+    """
+    def __init__(self, directory, index=None):
+        self._directory = directory
+        self._index = shared_snapshot_index(directory) if index is None else index
+        self._objects = ObjectStore(directory)
+        self._files = {}
+
+    def __getattr__(self, name):
+        return TracSourceMethod(self._dispatch, name)
+
+    def _dispatch(self, method, params):
+        if method == 'system.multicall':
+            results = []
+            for call in params[0]:
+                try:
+                    results.append([self._dispatch(call['methodName'], call['params'])])
+                except client.Fault as e:
+                    results.append({'faultCode': e.faultCode, 'faultString': e.faultString})
+            return results
+        entry = self._index.get(snapshot_key(method, params))
+        if entry is None:
+            raise client.Fault(404, 'Call not in the snapshot: %s%r' % (method, tuple(params)))
+        segment, offset, length = entry
+        if segment not in self._files:
+            self._files[segment] = open(snapshot_segment_path(self._directory, segment), 'rb')
+        f = self._files[segment]
+        f.seek(offset)
+        record = json.loads(gzip.decompress(f.read(length)))
+        if 'fault' in record:
+            raise client.Fault(*record['fault'])
+        return snapshot_decode(record['result'], self._objects.read_object)
+
+def trac_server_proxy(url=None):
+    """
+    Return a new connection to Trac. A connection must not be shared by threads.
+
+    If a snapshot or the environment of Trac is configured, it is read
+    instead of Trac.
+    """
+    if trac_snapshot and not url:
+        return TracSnapshot(trac_snapshot)
+    if trac_env and not url:
+        return TracEnvironment(trac_env)
+    url = url or trac_url
+    if url.startswith('https:'):
+        transport_class = TracSafeTransport
+    else:
+        transport_class = TracTransport
+    transport = transport_class(keep_alive=xmlrpc_keep_alive, gzip=xmlrpc_gzip, timeout=xmlrpc_timeout)
+    return client.ServerProxy(url, transport=transport)
+
+# counters of the requests to Trac by method: calls, retries, faults,
+# failures (after the last retry), seconds and max_seconds
+trac_statistics = defaultdict(lambda: defaultdict(float))
+trac_statistics_lock = threading.Lock()
+# times of the retries within the last hour, of which there are at most
+# retry_budget
+trac_retry_times = deque()
+
+def count_trac_request(method, counter, value=1):
+    with trac_statistics_lock:
+        trac_statistics[method][counter] += value
+
+def take_trac_retry(retries):
+    """
+    Take one of the retries left in the list ``retries`` and return
+    ``True``, or return ``False`` if none is left or the ``retry_budget``
+    of the last hour is used up.
+    """
+    with trac_statistics_lock:
+        now = monotonic()
+        while trac_retry_times and trac_retry_times[0] <= now - 3600:
+            trac_retry_times.popleft()
+        if retries[0] <= 0 or len(trac_retry_times) >= retry_budget:
+            return False
+        retries[0] -= 1
+        trac_retry_times.append(now)
+        return True
+
+def retry_trac_request(method, request, retries=None, split=False):
+    """
+    Return the result of ``request()``, a request to Trac.
+
+    After a transport error, the request is retried with exponential
+    backoff and jitter, as long as retries are left in the list
+    ``retries``, by default ``retry_attempts``, and the ``retry_budget`` of
+    the last hour is not used up. The requests for the calls of a chunk
+    share its retries. With ``split``, the error is raised after the delay
+    instead of the request being retried, for the caller to split it. A
+    fault is raised at once, as the server would answer the same again.
+    """
+    if retries is None:
+        retries = [retry_attempts]
     while True:
+        start = perf_counter()
         try:
-            if sleep_before_xmlrpc:
-                sleep(sleep_before_xmlrpc)
-            return source.ticket.changeLog(src_ticket_id)
+            result = request()
+        except client.Fault:
+            count_trac_request(method, 'faults')
+            raise
         except Exception as e:
-            print(e)
-            print('Sleeping')
-            sleep(sleep_before_xmlrpc_retry)
-            print('Retrying')
+            attempt = retry_attempts - retries[0]
+            if not take_trac_retry(retries):
+                count_trac_request(method, 'failures')
+                raise
+            count_trac_request(method, 'retries')
+            delay = min(retry_delay * 2**attempt, sleep_before_xmlrpc_retry)
+            delay *= random.uniform(0.5, 1)
+            log.warning('%s failed: %s; retrying in %.1f seconds' % (method, e, delay))
+            sleep(delay)
+            if split:
+                raise
+        else:
+            seconds = perf_counter() - start
+            with trac_statistics_lock:
+                statistics = trac_statistics[method]
+                statistics['calls'] += 1
+                statistics['seconds'] += seconds
+                statistics['max_seconds'] = max(statistics['max_seconds'], seconds)
+            return result
+
+def trac_call(source, method, *args, retries=None):
+    """
+    Return the result of the XML-RPC method of Trac, see ``retry_trac_request``.
+    """
+    return retry_trac_request(method, lambda: functools.reduce(getattr, method.split('.'), source)(*args),
+                              retries)
+
+@memoize(ignore=[0, 'source'])
+def get_all_milestones(source):
+    return trac_call(source, 'ticket.milestone.getAll')
+
+@memoize(ignore=[0, 'source'])
+def get_milestone(source, milestone_name):
+    return trac_call(source, 'ticket.milestone.get', milestone_name)
 
-@cache.memoize(ignore=[0, 'source'])
+@memoize(ignore=[0, 'source'])
+def get_changeLog(source, src_ticket_id):
+    return trac_call(source, 'ticket.changeLog', src_ticket_id)
+
+@memoize(ignore=[0, 'source'])
 def get_ticket_attachment(source, src_ticket_id, attachment_name):
-    while True:
+    return trac_call(source, 'ticket.getAttachment', src_ticket_id, attachment_name)
+
+@memoize(ignore=[0, 'source'])
+def get_wiki_pagenames(source):
+    return trac_call(source, 'wiki.getAllPages')
+
+@memoize(ignore=[0, 'source'])
+def get_wiki_page_info(source, pagename):
+    return trac_call(source, 'wiki.getPageInfo', pagename)
+
+@memoize(ignore=[0, 'source'])
+def get_wiki_page(source, pagename, version):
+    return trac_call(source, 'wiki.getPage', pagename, version)
+
+@memoize(ignore=[0, 'source'])
+def get_wiki_attachments(source, pagename):
+    return trac_call(source, 'wiki.listAttachments', pagename)
+
+@memoize(ignore=[0, 'source'])
+def get_wiki_attachment(source, path):
+    return trac_call(source, 'wiki.getAttachment', path)
+
+class ObjectStore:
+    """
+    Directory ``objects`` of files named by the SHA-256 hash of their content.
+    """
+    def __init__(self, directory):
+        self._directory = directory
+        os.makedirs(os.path.join(directory, 'objects'), exist_ok=True)
+
+    def object_path(self, digest):
+        return os.path.join(self._directory, 'objects', digest[:2], digest)
+
+    def add_object(self, data):
+        """
+        Store the data and return its hash. This may be called by several
+        threads.
+        """
+        digest = sha256(data).hexdigest()
+        path = self.object_path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            temporary_path = '%s.%d.tmp' % (path, threading.get_ident())
+            with open(temporary_path, 'wb') as f:
+                f.write(data)
+            os.replace(temporary_path, path)
+        return digest
+
+    def read_object(self, digest):
+        with open(self.object_path(digest), 'rb') as f:
+            return f.read()
+
+class AttachmentMirror(ObjectStore):
+    """
+    Directory of the attachments of tickets, which are stored in files named
+    by the SHA-256 hash of their content, with the index ``index.jsonl`` of
+    these hashes by ticket and file name.
+    """
+    def __init__(self, directory):
+        super().__init__(directory)
+        self._index_path = os.path.join(directory, 'index.jsonl')
+        self._index = {}  # (ticket id, filename) -> hash
+        self._lock = threading.Lock()
+        if os.path.exists(self._index_path):
+            with open(self._index_path) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # interrupted while writing the entry
+                    self._index[entry['ticket'], entry['filename']] = entry['sha256']
+
+    def __contains__(self, key):
+        return key in self._index
+
+    def path(self, src_ticket_id, filename):
+        """
+        Return the path of the file of the attachment, or ``None`` if it is
+        not in the mirror.
+        """
+        digest = self._index.get((src_ticket_id, filename))
+        return digest and self.object_path(digest)
+
+    def add(self, src_ticket_id, filename, data):
+        """
+        Store the attachment. This may be called by several threads.
+        """
+        digest = self.add_object(data)
+        with self._lock:
+            self._index[src_ticket_id, filename] = digest
+            with open(self._index_path, 'a') as f:
+                f.write(json.dumps({'ticket': src_ticket_id, 'filename': filename,
+                                    'sha256': digest, 'size': len(data)}) + '\n')
+
+attachment_mirror = None
+
+def ticket_attachment(source, src_ticket_id, attachment_name):
+    """
+    Return the attachment for ``gh_comment_issue``, or ``None`` if it
+    does not exist.
+
+    An attachment in the ``attachment_mirror`` is not read but copied by
+    ``write_attachment``.
+    """
+    if attachment_mirror is not None and attachment_export:
+        path = attachment_mirror.path(src_ticket_id, attachment_name)
+        if path:
+            return {'attachment_file': path, 'attachment_name': attachment_name}
+    try:
+        attachment = get_ticket_attachment(source, src_ticket_id, attachment_name)
+    except client.Fault as e:
+        log.warning('Attachment %s of ticket #%s not found: %s' % (attachment_name, src_ticket_id, e.faultString))
+        return None
+    return {'attachment': attachment.data, 'attachment_name': attachment_name}
+
+def multicall_results(method, results):
+    """
+    Return the list of the results of a ``client.MultiCall``, with the
+    ``client.Fault`` of each call of ``method`` that failed in place of its
+    result.
+    """
+    items = []
+    for i in range(len(results.results)):
         try:
-            return source.ticket.getAttachment(src_ticket_id, attachment_name)
-        except Exception as e:
-            print(e)
-            print('Sleeping')
-            sleep(sleep_before_xmlrpc_retry)
-            print('Retrying')
+            items.append(results[i])
+        except client.Fault as e:
+            count_trac_request(method, 'faults')
+            items.append(e)
+    return items
+
+def multicall(source, method, args_list, retries):
+    """
+    Return the results of the calls of ``method`` with the given arguments,
+    made in a single request, with the ``client.Fault`` of each call that
+    failed in place of its result.
+
+    If the request fails, the calls are split in two halves which are
+    requested separately, and a single call is retried. The requests take
+    their retries from the list ``retries``.
+    """
+    if len(args_list) == 1:
+        try:
+            return [trac_call(source, method, *args_list[0], retries=retries)]
+        except client.Fault as e:
+            return [e]
+    call = client.MultiCall(source)
+    for args in args_list:
+        functools.reduce(getattr, method.split('.'), call)(*args)
+    try:
+        return multicall_results(method, retry_trac_request('system.multicall', call, retries, split=True))
+    except Exception as e:
+        log.warning('Splitting the request of %d calls of %s: %s' % (len(args_list), method, e))
+        half = len(args_list) // 2
+        return (multicall(source, method, args_list[:half], retries)
+                + multicall(source, method, args_list[half:], retries))
+
+def fetch_memoized(source, memoized, method, args_list):
+    """
+    Store the results of the calls of ``method`` with the given arguments in
+    the cache of the memoized function that makes these calls one at a time.
 
-@cache.memoize()
-def get_all_tickets(filter_issues):
+    The calls whose results are not cached yet are made in requests of
+    ``multicall_size`` calls, which share ``retry_attempts`` retries. The
+    faults are not cached but raised by the memoized function when it is
+    called.
+    """
+    args_list = [args for args in args_list if memoized.__cache_key__(source, *args) not in cache]
+    for start in range(0, len(args_list), max(multicall_size, 1)):
+        chunk = args_list[start:start + multicall_size]
+        for args, result in zip(chunk, multicall(source, method, chunk, [retry_attempts])):
+            if not isinstance(result, client.Fault):
+                cache.set(memoized.__cache_key__(source, *args), result, retry=True)
+
+def fetch_wiki_pages(source, pagenames):
+    """
+    Store the information and the contents of the wiki pages in the cache,
+    in requests of ``multicall_size`` calls. The contents are cached by
+    version, so only the pages changed since they were cached are fetched
+    again.
+    """
+    fetch_memoized(source, get_wiki_page_info, 'wiki.getPageInfo', [(pagename,) for pagename in pagenames])
+    versions = [(pagename, info['version']) for pagename, info in
+                ((pagename, get_wiki_page_info(source, pagename)) for pagename in pagenames)
+                if info['author'] not in wiki_exclude_authors]
+    fetch_memoized(source, get_wiki_page, 'wiki.getPage', versions)
+
+@memoize(ignore=[0, 'source'])
+def get_ticket_ids(source, filter_issues):
+    return trac_call(source, 'ticket.query', filter_issues)
+
+@memoize(ignore=[0, 'source'])
+def get_tickets_page(source, filter_issues, page, page_size):
+    src_ticket_ids = get_ticket_ids(source, filter_issues)[page * page_size:(page + 1) * page_size]
     call = client.MultiCall(source)
-    for ticket in source.ticket.query(filter_issues):
-        call.ticket.get(ticket)
-    return call()
+    for src_ticket_id in src_ticket_ids:
+        call.ticket.get(src_ticket_id)
+    results = multicall_results('ticket.get', retry_trac_request('system.multicall', call))
+    tickets = []
+    for src_ticket_id, ticket in zip(src_ticket_ids, results):
+        if isinstance(ticket, client.Fault):
+            log.warning('Ticket #%s not found: %s' % (src_ticket_id, ticket.faultString))
+        else:
+            tickets.append(ticket)
+    return tickets
+
+@memoize(ignore=[0, 'source'])
+def get_ticket(source, src_ticket_id):
+    return trac_call(source, 'ticket.get', src_ticket_id)
+
+def get_all_tickets(source, filter_issues, only_issues = None, blacklist_issues = None):
+    """
+    Generator of the tickets of the query, without those left out by
+    ``only_issues`` and ``blacklist_issues``.
+
+    The tickets are fetched and cached in pages of ``ticket_page_size``
+    tickets, so that an interrupted download resumes at the first page
+    that is not cached. If ``only_issues`` is given, only these tickets
+    are fetched, and the query is only made if ``filter_issues`` is set
+    in the configuration file.
+    """
+    if only_issues:
+        if config.has_option('issues', 'filter_issues'):
+            src_ticket_ids = [i for i in get_ticket_ids(source, filter_issues) if i in only_issues]
+        else:
+            src_ticket_ids = sorted(only_issues)
+        if blacklist_issues:
+            src_ticket_ids = [i for i in src_ticket_ids if i not in blacklist_issues]
+        fetch_memoized(source, get_ticket, 'ticket.get', [(i,) for i in src_ticket_ids])
+        for src_ticket_id in src_ticket_ids:
+            try:
+                ticket = get_ticket(source, src_ticket_id)
+            except client.Fault as e:
+                log.warning('Ticket #%s not found: %s' % (src_ticket_id, e.faultString))
+                continue
+            yield ticket
+        return
+    for start in range(0, len(get_ticket_ids(source, filter_issues)), ticket_page_size):
+        for ticket in get_tickets_page(source, filter_issues, start // ticket_page_size, ticket_page_size):
+            if not (blacklist_issues and ticket[0] in blacklist_issues):
+                yield ticket
+
+def sync_trac_cache(source, since=None):
+    """
+    Remove the entries of the cache made stale by the changes in Trac since
+    the datetime ``since``, by default the watermark recorded by the previous
+    sync or when the cache was created, and record the new watermark.
+
+    The changelogs, attachments and tickets of the changed tickets are
+    removed, and so are the pages of tickets of ``filter_issues`` that
+    contain them or that are shifted by new tickets. The milestones are
+    always removed, as they are few. The information and the attachments
+    of the changed wiki pages are removed, their contents being cached by
+    version, and the list of the wiki pages is fetched again.
+
+    Return the numbers of changed tickets, of changed wiki pages and of
+    removed entries, or ``None`` if no watermark is recorded and ``since``
+    is not given, as for a cache filled by an earlier version.
+    """
+    watermark = since or cache.get('sync_watermark')
+    new_watermark = datetime.now(timezone.utc) - timedelta(seconds=sync_overlap)
+    if watermark is None:
+        log.error('No watermark of the cache is recorded; give the time since which '
+                  'it may be stale to sync_trac_cache.py, or remove %s' % cache_directory)
+        return None
+    since = client.DateTime(watermark.utctimetuple())
+    log.info('Syncing the changes in Trac since %s' % since)
+    src_ticket_ids = set(trac_call(source, 'ticket.getRecentChanges', since))
+    pagenames = trac_call(source, 'wiki.getRecentChanges', since)
+
+    keys = []
+    for src_ticket_id in src_ticket_ids:
+        key = get_changeLog.__cache_key__(source, src_ticket_id)
+        for time, author, change_type, oldvalue, newvalue, permanent in cache.get(key, ()):
+            if change_type == 'attachment':
+                keys.append(get_ticket_attachment.__cache_key__(source, src_ticket_id, newvalue))
+        keys.append(key)
+        keys.append(get_ticket.__cache_key__(source, src_ticket_id))
+
+    key = get_ticket_ids.__cache_key__(source, filter_issues)
+    old_ids = cache.get(key)
+    if old_ids is not None:
+        new_ids = trac_call(source, 'ticket.query', filter_issues)
+        cache.set(key, new_ids)
+        shifted = 0
+        while shifted < min(len(old_ids), len(new_ids)) and old_ids[shifted] == new_ids[shifted]:
+            shifted += 1
+        pages = {i // ticket_page_size for i, src_ticket_id in enumerate(new_ids)
+                 if src_ticket_id in src_ticket_ids}
+        if shifted < max(len(old_ids), len(new_ids)):
+            pages.update(range(shifted // ticket_page_size,
+                               (max(len(old_ids), len(new_ids)) - 1) // ticket_page_size + 1))
+        keys.extend(get_tickets_page.__cache_key__(source, filter_issues, page, ticket_page_size)
+                    for page in pages)
+
+    key = get_wiki_pagenames.__cache_key__(source)
+    if key in cache:
+        cache.set(key, trac_call(source, 'wiki.getAllPages'))
+    for info in pagenames:
+        keys.append(get_wiki_page_info.__cache_key__(source, info['name']))
+        key = get_wiki_attachments.__cache_key__(source, info['name'])
+        for path in cache.get(key, ()):
+            keys.append(get_wiki_attachment.__cache_key__(source, path))
+        keys.append(key)
+
+    for milestone_name in cache.get(get_all_milestones.__cache_key__(source), ()):
+        keys.append(get_milestone.__cache_key__(source, milestone_name))
+    keys.append(get_all_milestones.__cache_key__(source))
+
+    removed = sum(1 for key in keys if cache.delete(key))
+    cache.set('sync_watermark', new_watermark)
+    return len(src_ticket_ids), len(pagenames), removed
+
+def lookahead(iterable, size):
+    """
+    Generator of the lists of the next ``size`` items of ``iterable``,
+    starting with each of its items in turn.
+    """
+    iterator = iter(iterable)
+    window = list(islice(iterator, size))
+    while window:
+        yield window
+        window = window[1:] + list(islice(iterator, 1))
+
+class TracPrefetcher:
+    """
+    Pool of threads fetching the changelogs and attachments of upcoming
+    tickets from Trac while the current ticket is converted.
+
+    The changelogs of the tickets submitted together are fetched in
+    requests of ``multicall_size`` calls. They are stored in the cache like
+    those fetched by the main loop.
+    """
+    def __init__(self, threads):
+        self._executor = ThreadPoolExecutor(threads)
+        self._local = threading.local()
+        self._futures = {}  # ticket id -> future
+
+    def _fetch(self, src_ticket_ids):
+        if not hasattr(self._local, 'source'):
+            self._local.source = trac_server_proxy()
+        source = self._local.source
+        fetch_memoized(source, get_changeLog, 'ticket.changeLog', [(i,) for i in src_ticket_ids])
+        changelogs = {}
+        for src_ticket_id in src_ticket_ids:
+            changelog = changelogs[src_ticket_id] = get_changeLog(source, src_ticket_id)
+            for time, author, change_type, oldvalue, newvalue, permanent in changelog:
+                if change_type == 'attachment' and not (attachment_mirror is not None
+                                                        and (src_ticket_id, newvalue) in attachment_mirror):
+                    try:
+                        get_ticket_attachment(source, src_ticket_id, newvalue)
+                    except client.Fault:
+                        pass  # reported by ticket_attachment
+        return changelogs
+
+    def submit(self, tickets):
+        """
+        Submit the fetching of the given tickets.
+        """
+        src_ticket_ids = [src_ticket_id for src_ticket_id, time_created, time_changed, src_ticket_data in tickets
+                          if src_ticket_id not in self._futures]
+        if src_ticket_ids:
+            future = self._executor.submit(self._fetch, src_ticket_ids)
+            for src_ticket_id in src_ticket_ids:
+                self._futures[src_ticket_id] = future
+
+    def result(self, src_ticket_id):
+        """
+        Return the changelog of a ticket, or ``None`` if it was not submitted.
+        """
+        future = self._futures.get(src_ticket_id)
+        if future is None:
+            return None
+        return future.result()[src_ticket_id]
+
+    def done(self, src_ticket_id):
+        self._futures.pop(src_ticket_id, None)
+
+    def shutdown(self):
+        self._executor.shutdown(cancel_futures=True)
+
+trac_prefetcher = None
+
+def ticket_changeLog(source, src_ticket_id):
+    """
+    Return the changelog of a ticket, fetched in advance if possible.
+    """
+    if trac_prefetcher is not None:
+        changelog = trac_prefetcher.result(src_ticket_id)
+        if changelog is not None:
+            return changelog
+    return get_changeLog(source, src_ticket_id)
+
+# descriptions with more lines are compared without their common leading and trailing lines
+large_diff_lines = 1000
+
+def description_diff(old, new, n=3):
+    """
+    Return the lines of the unified diff of two versions of a description.
+
+    For long descriptions, the common leading and trailing lines are left
+    out of the comparison, which is quadratic in the worst case.
+    """
+    if len(old) + len(new) < large_diff_lines:
+        return list(unified_diff(old, new, n=n, lineterm=''))
+    prefix = 0
+    while prefix < min(len(old), len(new)) and old[prefix] == new[prefix]:
+        prefix += 1
+    suffix = 0
+    while (suffix < min(len(old), len(new)) - prefix
+           and old[len(old) - suffix - 1] == new[len(new) - suffix - 1]):
+        suffix += 1
+    skip = max(0, prefix - n)
+    tail = max(0, suffix - n)
+
+    def shift(m):
+        return str(int(m.group(0)) + skip)
+
+    lines = []
+    for line in unified_diff(old[skip:len(old) - tail], new[skip:len(new) - tail], n=n, lineterm=''):
+        if line.startswith('@@'):
+            line = re.sub(r'(?<=[-+])\d+', shift, line)
+        lines.append(line)
+    return lines
+
+def ticket_conversion_texts(src_ticket_data, changelog):
+    """
+    Return the texts of a ticket that are converted by ``convert_issues``.
+    """
+    texts = [src_ticket_data.get('description', '')]
+    for time, author, change_type, oldvalue, newvalue, permanent in changelog:
+        if change_type == 'comment' and newvalue.strip():
+            texts.append(newvalue.strip())
+        elif change_type == 'description':
+            if github:
+                texts.append(oldvalue.strip())
+                break  # the first old value is the initial description
+            texts += [oldvalue, newvalue]
+    return texts
+
+def prefetch_conversions(source, tickets):
+    """
+    Submit the conversion of the texts of the given tickets to the conversion pool.
+    """
+    for src_ticket_id, time_created, time_changed, src_ticket_data in tickets:
+        changelog = ticket_changeLog(source, src_ticket_id)
+        conversion_pool.submit(src_ticket_id, ticket_conversion_texts(src_ticket_data, changelog))
 
 def convert_issues(source, dest, only_issues = None, blacklist_issues = None):
+    global conversion_pool, conversion_memo, trac_prefetcher, attachment_mirror
     conv_help = IssuesConversionHelper(source)
+    if attachment_mirror_dir:
+        attachment_mirror = AttachmentMirror(attachment_mirror_dir)
+    if conversion_processes:
+        conversion_pool = ConversionPool(conversion_processes, conv_help)
+    if prefetch_tickets:
+        trac_prefetcher = TracPrefetcher(prefetch_threads)
+    conversion_memo = {}
+    try:
+        convert_tickets(source, dest, conv_help, only_issues, blacklist_issues)
+    finally:
+        conversion_memo = None
+        if trac_prefetcher is not None:
+            trac_prefetcher.shutdown()
+            trac_prefetcher = None
+        if conversion_pool is not None:
+            conversion_pool.shutdown()
+            conversion_pool = None
+
+def convert_tickets(source, dest, conv_help, only_issues = None, blacklist_issues = None):
 
     if migrate_milestones:
-        for milestone_name in get_all_milestones(source):
+        milestone_names = get_all_milestones(source)
+        fetch_memoized(source, get_milestone, 'ticket.milestone.get', [(name,) for name in milestone_names])
+        for milestone_name in milestone_names:
             milestone = get_milestone(source, milestone_name)
             log.debug(f'Milestone: {milestone}')
             title = milestone.pop('name')
@@ -2199,15 +4713,29 @@ def convert_issues(source, dest, only_issues = None, blacklist_issues = None):
     nextticketid = 1
     ticketcount = 0
 
-    for src_ticket in get_all_tickets(filter_issues):
-        src_ticket_id, time_created, time_changed, src_ticket_data = src_ticket
-
-        if only_issues and src_ticket_id not in only_issues:
-            print("SKIP unwanted ticket #%s" % src_ticket_id)
-            continue
-        if blacklist_issues and src_ticket_id in blacklist_issues:
-            print("SKIP blacklisted ticket #%s" % src_ticket_id)
-            continue
+    # the current ticket and the upcoming tickets, whose changelogs are
+    # fetched and whose texts are converted in advance
+    fetch_ahead = max(prefetch_tickets, 1)
+    window = max(fetch_ahead + max(multicall_size, 1), conversion_lookahead)
+    fetched = 0
+    previous_ticket_id = None
+    for index, tickets in enumerate(lookahead(get_all_tickets(source, filter_issues, only_issues, blacklist_issues), window)):
+        src_ticket_id, time_created, time_changed, src_ticket_data = tickets[0]
+        if trac_prefetcher is not None and previous_ticket_id is not None:
+            trac_prefetcher.done(previous_ticket_id)
+        # fetch the changelogs of the upcoming tickets in chunks
+        while fetched < index + min(fetch_ahead, len(tickets)):
+            chunk = tickets[fetched - index:fetched - index + max(multicall_size, 1)]
+            if trac_prefetcher is not None:
+                trac_prefetcher.submit(chunk)
+            elif multicall_size > 1:
+                fetch_memoized(source, get_changeLog, 'ticket.changeLog', [(t[0],) for t in chunk])
+            fetched += len(chunk)
+        if conversion_pool is not None:
+            if previous_ticket_id is not None:
+                conversion_pool.done(previous_ticket_id)
+            prefetch_conversions(source, tickets[:conversion_lookahead])
+        previous_ticket_id = src_ticket_id
 
         if github and not only_issues and not blacklist_issues and not config.has_option('issues', 'filter_issues') :
             while nextticketid < src_ticket_id :
@@ -2229,11 +4757,12 @@ def convert_issues(source, dest, only_issues = None, blacklist_issues = None):
         # src_ticket_data.keys(): ['status', 'changetime', 'description', 'reporter', 'cc', 'type', 'milestone', '_ts',
         # 'component', 'owner', 'summary', 'platform', 'version', 'time', 'keywords', 'resolution']
 
-        changelog = get_changeLog(source, src_ticket_id)
+        changelog = ticket_changeLog(source, src_ticket_id)
 
         log.info('Migrating ticket #%s (%3d changes): "%s"' % (src_ticket_id, len(changelog), src_ticket_data['summary'][:50].replace('"', '\'')))
 
         conv_help.set_ticket_paths(src_ticket_id)
+        conversion_memo.clear()
 
         def attr_value(s):
             "Markup for an attribute value. Boldface if nonempty."
@@ -2559,8 +5088,9 @@ def convert_issues(source, dest, only_issues = None, blacklist_issues = None):
             }
             if change_type == "attachment":
                 # The attachment may be described in the next comment
-                attachments.append({'attachment': get_ticket_attachment(source, src_ticket_id, newvalue).data,
-                                    'attachment_name': newvalue})
+                attachment = ticket_attachment(source, src_ticket_id, newvalue)
+                if attachment is not None:
+                    attachments.append(attachment)
             elif change_type == "comment":
                 # oldvalue is here either x or y.x, where x is the number of this comment and y is the number of the comment that is replied to
                 m = re.fullmatch(r'([0-9]+[.])?([0-9]+)', oldvalue)
@@ -2644,9 +5174,8 @@ def convert_issues(source, dest, only_issues = None, blacklist_issues = None):
                     body = 'Description changed:\n``````diff\n'
                     old_description = trac2markdown(oldvalue, '/issues/', conv_help, False)
                     new_description = trac2markdown(newvalue, '/issues/', conv_help, False)
-                    body += '\n'.join(unified_diff(old_description.split('\n'),
-                                                   new_description.split('\n'),
-                                                   lineterm=''))
+                    body += '\n'.join(description_diff(old_description.split('\n'),
+                                                        new_description.split('\n')))
                     body += '\n``````\n'
                     comment_data['note'] = body
                     gh_comment_issue(dest, issue, comment_data, src_ticket_id)
@@ -2713,36 +5242,34 @@ def convert_issues(source, dest, only_issues = None, blacklist_issues = None):
             sleep(sleep_after_10tickets)
 
 def convert_wiki(source, dest):
-    exclude_authors = ['trac']
-
     if not os.path.isdir(wiki_export_dir):
         os.makedirs(wiki_export_dir)
 
-    client.MultiCall(source)
     conv_help = WikiConversionHelper(source)
 
     if os.path.exists('links.txt'):
         os.remove('links.txt')
 
-    for pagename in source.wiki.getAllPages():
-        info = source.wiki.getPageInfo(pagename)
-        if info['author'] in exclude_authors:
+    pagenames = get_wiki_pagenames(source)
+    fetch_wiki_pages(source, pagenames)
+    for pagename in pagenames:
+        info = get_wiki_page_info(source, pagename)
+        if info['author'] in wiki_exclude_authors:
             continue
 
-        page = source.wiki.getPage(pagename)
+        page = get_wiki_page(source, pagename, info['version'])
         print ("Migrate Wikipage", pagename)
 
         # Github wiki does not have folder structure
         gh_pagename = ' '.join(pagename.split('/'))
 
         conv_help.set_wikipage_paths(pagename)
-        converted = trac2markdown(page, os.path.dirname('/wiki/%s' % gh_pagename), conv_help)
 
         attachments = []
-        for attachment in source.wiki.listAttachments(pagename):
+        for attachment in get_wiki_attachments(source, pagename):
             print ("  Attachment", attachment)
             attachmentname = os.path.basename(attachment)
-            attachmentdata = source.wiki.getAttachment(attachment).data
+            attachmentdata = get_wiki_attachment(source, attachment).data
 
             dirname = os.path.join(wiki_export_dir, gh_pagename)
             if not os.path.isdir(dirname):
@@ -2751,20 +5278,53 @@ def convert_wiki(source, dest):
             open(os.path.join(dirname, attachmentname), 'wb').write(attachmentdata)
             attachmenturl = gh_pagename + '/' + attachmentname
 
-            converted = re.sub(r'\[attachment:%s\s([^\[\]]+)\]' % re.escape(attachmentname), r'[\1](%s)' % attachmenturl, converted)
-
             attachments.append((attachmentname, attachmenturl))
 
+        def link_attachments(converted):
+            for (name, url) in attachments:
+                converted = re.sub(r'\[attachment:%s\s([^\[\]]+)\]' % re.escape(name), r'[\1](%s)' % url, converted)
+            return converted
+
         # add a list of attachments
+        attachments_list = ''
         if len(attachments) > 0 :
-            converted += '\n---\n\nAttachments:\n'
+            attachments_list += '\n---\n\nAttachments:\n'
             for (name, url) in attachments :
-                converted += ' * [' + name + '](' + url + ')\n'
+                attachments_list += ' * [' + name + '](' + url + ')\n'
 
         # TODO we could use the GitHub API to write into the Wiki repository of the GitHub project
         outfile = os.path.join(wiki_export_dir, gh_pagename + '.md')
         # For wiki page names with slashes
         os.makedirs(os.path.dirname(outfile), exist_ok=True)
+
+        if len(page) > streaming_page_size:
+            # write the page while it is converted
+            pieces = trac2markdown_lines(page, os.path.dirname('/wiki/%s' % gh_pagename), conv_help)
+            try:
+                with open(outfile, 'w', encoding='utf-8') as f:
+                    separator = ''
+                    pending = None
+                    for lines in guarded_conversion_lines(pieces, page, conv_help):
+                        pending = lines if pending is None else pending + '\n' + lines
+                        # an attachment link may be broken over several lines
+                        if pending.rfind('[attachment:') > pending.rfind(']'):
+                            continue
+                        f.write(separator + link_attachments(pending))
+                        separator = '\n'
+                        pending = None
+                    if pending is not None:
+                        f.write(separator + link_attachments(pending))
+                    f.write(attachments_list)
+            except ConversionTimeout as e:
+                log.warning('%s; the page is rendered literally' % e)
+                conversion_cache_statistics['timeouts'] += 1
+                with open(outfile, 'w', encoding='utf-8') as f:
+                    f.write(link_attachments(literal_markdown(page)) + attachments_list)
+            continue
+
+        converted = trac2markdown(page, os.path.dirname('/wiki/%s' % gh_pagename), conv_help)
+        converted = link_attachments(converted) + attachments_list
+
         try :
             open(outfile, 'w').write(converted)
         except UnicodeEncodeError as e :
@@ -2812,6 +5372,55 @@ def output_unmapped_milestones(data):
             for key, frequency in data:
                 f.write(' '.join([key, str(frequency)]) +'\n')
 
+def output_cache_statistics(data):
+    table = Table(title="Operations on trac_cache (%d shards)" % cache_shards)
+    table.add_column("Operation", justify="right", style="cyan", no_wrap=True)
+    table.add_column("Calls", style="magenta")
+    table.add_column("Hits", style="magenta")
+    table.add_column("Misses", style="magenta")
+    table.add_column("Mean (ms)", justify="right", style="magenta")
+    table.add_column("Max (ms)", justify="right", style="magenta")
+
+    for operation, statistics in data:
+        table.add_row(operation, '%d' % statistics['calls'], '%d' % statistics['hits'],
+                      '%d' % statistics['misses'], '%.2f' % (1000 * statistics['seconds'] / statistics['calls']),
+                      '%.2f' % (1000 * statistics['max_seconds']))
+
+    console = Console()
+    console.print(table)
+
+def output_trac_statistics(data):
+    table = Table(title="Requests to Trac")
+    table.add_column("Method", justify="right", style="cyan", no_wrap=True)
+    table.add_column("Calls", style="magenta")
+    table.add_column("Retries", style="magenta")
+    table.add_column("Faults", style="magenta")
+    table.add_column("Failures", style="magenta")
+    table.add_column("Mean (ms)", justify="right", style="magenta")
+    table.add_column("Max (ms)", justify="right", style="magenta")
+
+    for method, statistics in data:
+        calls = statistics['calls']
+        table.add_row(method, '%d' % calls, '%d' % statistics['retries'], '%d' % statistics['faults'],
+                      '%d' % statistics['failures'],
+                      '%.1f' % (1000 * statistics['seconds'] / calls) if calls else '',
+                      '%.1f' % (1000 * statistics['max_seconds']))
+
+    console = Console()
+    console.print(table)
+
+def output_slowest_conversions(data):
+    table = Table(title="Slowest conversions")
+    table.add_column("Seconds", justify="right", style="magenta")
+    table.add_column("Item", style="cyan", no_wrap=True)
+    table.add_column("Slowest step", style="cyan", no_wrap=True)
+
+    for seconds, item, step in data:
+        table.add_row('%.3f' % seconds, item, step)
+
+    console = Console()
+    console.print(table)
+
 min_keyword_frequency_displayed = 20
 def output_keyword_frequency(data):
     table = Table(title="Unmapped keyword frequency")
@@ -2846,7 +5455,8 @@ def output_component_frequency(data):
     if not os.path.exists('component_frequency.txt'):
         with open('component_frequency.txt', 'a') as f:
             for key, frequency in data:
-                f.write(' '.join([key, str(frequency)]) +'\n')
+                # key is None for suppressed components
+                f.write(' '.join([str(key), str(frequency)]) +'\n')
 
 if __name__ == "__main__":
 
@@ -2856,7 +5466,10 @@ if __name__ == "__main__":
         level="INFO", format=FORMAT, datefmt="[%X]", handlers=[RichHandler()]
     )
 
-    source = client.ServerProxy(trac_url)
+    if use_conversion_cache:
+        open_conversion_cache()
+
+    source = trac_server_proxy()
 
     github = None
     dest = None
@@ -2908,5 +5521,19 @@ if __name__ == "__main__":
 
         output_unmapped_users(sorted(unmapped_users.items(), key=lambda x: (x[0][0].lower(), *x[0][1:])))
         output_unmapped_milestones(sorted(unmapped_milestones.items(), key=lambda x: -x[1]))
+        if trac_statistics:
+            output_trac_statistics(sorted(trac_statistics.items()))
+        if cache_statistics:
+            output_cache_statistics(sorted(cache_statistics.items()))
         output_keyword_frequency(sorted(keyword_frequency.items(), key=lambda x: -x[1]))
         output_component_frequency(sorted(component_frequency.items(), key=lambda x: -x[1]))
+        if conversion_cache is not None:
+            log.info('Conversion cache: %d hits, %d misses' % (conversion_cache_statistics['hits'],
+                                                              conversion_cache_statistics['misses']))
+        if conversion_processes:
+            log.info('Converted %d texts in worker processes' % conversion_cache_statistics['parallel'])
+        if conversion_cache_statistics['timeouts']:
+            log.warning('%d conversions interrupted and rendered literally, which are not cached'
+                        % conversion_cache_statistics['timeouts'])
+        if slowest_conversions:
+            output_slowest_conversions(sorted(conversion_timings, reverse=True))
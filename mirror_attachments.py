@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+# Download the attachments of the tickets from Trac into the offline mirror
+# configured by mirror_dir in the attachments section, so that the migration
+# does not request them from Trac. An interrupted download resumes with the
+# attachments that are not mirrored yet.
+#
+# Usage: python3 mirror_attachments.py [migrate.cfg]
+
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from xmlrpc import client
+
+import migrate
+from migrate import (AttachmentMirror, get_all_tickets, get_changeLog, fetch_memoized,
+                     trac_call, trac_server_proxy)
+
+local = threading.local()
+
+def download(mirror, src_ticket_id, filename):
+    if not hasattr(local, 'source'):
+        local.source = trac_server_proxy()
+    try:
+        attachment = trac_call(local.source, 'ticket.getAttachment', src_ticket_id, filename)
+    except client.Fault as e:
+        migrate.log.warning('Attachment %s of ticket #%s not found: %s'
+                            % (filename, src_ticket_id, e.faultString))
+        return None
+    mirror.add(src_ticket_id, filename, attachment.data)
+    return len(attachment.data)
+
+if __name__ == '__main__':
+    from rich.logging import RichHandler
+    logging.basicConfig(level="INFO", format="%(message)s", datefmt="[%X]", handlers=[RichHandler()])
+
+    if not migrate.attachment_mirror_dir:
+        raise SystemExit('Set mirror_dir in the attachments section of the configuration file')
+    mirror = AttachmentMirror(migrate.attachment_mirror_dir)
+    source = trac_server_proxy()
+
+    tickets = get_all_tickets(source, migrate.filter_issues, migrate.only_issues, migrate.blacklist_issues)
+    chunk_size = max(migrate.multicall_size, 1)
+    ticket_count = 0
+    mirrored = 0
+    futures = []
+    with ThreadPoolExecutor(migrate.prefetch_threads) as executor:
+        while True:
+            src_ticket_ids = [ticket[0] for ticket in islice(tickets, chunk_size)]
+            if not src_ticket_ids:
+                break
+            ticket_count += len(src_ticket_ids)
+            fetch_memoized(source, get_changeLog, 'ticket.changeLog', [(i,) for i in src_ticket_ids])
+            for src_ticket_id in src_ticket_ids:
+                for time, author, change_type, oldvalue, newvalue, permanent in get_changeLog(source, src_ticket_id):
+                    if change_type != 'attachment':
+                        continue
+                    if (src_ticket_id, newvalue) in mirror:
+                        mirrored += 1
+                    else:
+                        futures.append(executor.submit(download, mirror, src_ticket_id, newvalue))
+        sizes = [future.result() for future in futures]
+
+    downloaded = [size for size in sizes if size is not None]
+    migrate.log.info('%d attachments of %d tickets: %d already mirrored, %d downloaded (%d bytes), %d not found'
+                     % (mirrored + len(sizes), ticket_count, mirrored, len(downloaded), sum(downloaded),
+                        len(sizes) - len(downloaded)))
+    migrate.output_trac_statistics(sorted(migrate.trac_statistics.items()))
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# Fill trac_cache with the tickets, changelogs, attachments, milestones and
+# wiki pages that the migration requests from Trac, without converting them,
+# so that the migration can then be run repeatedly from the cache. Only what
+# the configuration file migrates is fetched, by prefetch_threads threads (in
+# the issues section) within the rate limit of requests_per_second and
+# requests_burst (in the source section). An interrupted prefetch resumes
+# with what is not cached yet.
+#
+# Usage: python3 prefetch_trac_cache.py [migrate.cfg]
+
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from xmlrpc import client
+
+from rich.progress import (BarColumn, MofNCompleteColumn, Progress, TextColumn,
+                           TimeElapsedColumn, TimeRemainingColumn)
+
+import migrate
+from migrate import (AttachmentMirror, TracPrefetcher, fetch_memoized, fetch_wiki_pages,
+                     get_all_milestones, get_all_tickets, get_milestone, get_ticket_ids,
+                     get_wiki_attachment, get_wiki_attachments, get_wiki_page_info,
+                     get_wiki_pagenames, lookahead, trac_server_proxy)
+
+local = threading.local()
+
+def prefetch_wiki_attachments(pagename):
+    if not hasattr(local, 'source'):
+        local.source = trac_server_proxy()
+    source = local.source
+    if get_wiki_page_info(source, pagename)['author'] in migrate.wiki_exclude_authors:
+        return
+    try:
+        for path in get_wiki_attachments(source, pagename):
+            get_wiki_attachment(source, path)
+    except client.Fault as e:
+        migrate.log.warning('Attachments of wiki page %s not fetched: %s' % (pagename, e.faultString))
+
+def prefetch_tickets(progress, source, threads):
+    if migrate.only_issues:
+        total = len(migrate.only_issues)
+    else:
+        total = len(get_ticket_ids(source, migrate.filter_issues))
+    tickets_task = progress.add_task('Tickets', total=total)
+    changelogs_task = progress.add_task('Changelogs and attachments', total=total)
+    # the tickets are fetched as the changelogs are, with the chunks of the
+    # upcoming tickets submitted in advance to keep the threads busy
+    chunk_size = max(migrate.multicall_size, 1)
+    fetch_ahead = 2 * threads * chunk_size
+    prefetcher = TracPrefetcher(threads)
+    try:
+        fetched = 0
+        all_tickets = get_all_tickets(source, migrate.filter_issues, migrate.only_issues, migrate.blacklist_issues)
+        for index, tickets in enumerate(lookahead(all_tickets, fetch_ahead + chunk_size)):
+            while fetched < index + min(fetch_ahead, len(tickets)):
+                chunk = tickets[fetched - index:fetched - index + chunk_size]
+                prefetcher.submit(chunk)
+                fetched += len(chunk)
+                progress.advance(tickets_task, len(chunk))
+            prefetcher.result(tickets[0][0])
+            prefetcher.done(tickets[0][0])
+            progress.advance(changelogs_task)
+    finally:
+        prefetcher.shutdown()
+    progress.update(tickets_task, total=fetched, completed=fetched)
+    progress.update(changelogs_task, total=fetched, completed=fetched)
+
+def prefetch_milestones(progress, source):
+    milestone_names = get_all_milestones(source)
+    task = progress.add_task('Milestones', total=len(milestone_names))
+    chunk_size = max(migrate.multicall_size, 1)
+    for start in range(0, len(milestone_names), chunk_size):
+        chunk = milestone_names[start:start + chunk_size]
+        fetch_memoized(source, get_milestone, 'ticket.milestone.get', [(name,) for name in chunk])
+        progress.advance(task, len(chunk))
+
+def prefetch_wiki(progress, source, threads):
+    pagenames = get_wiki_pagenames(source)
+    task = progress.add_task('Wiki pages', total=len(pagenames))
+    chunk_size = max(migrate.multicall_size, 1)
+    for start in range(0, len(pagenames), chunk_size):
+        chunk = pagenames[start:start + chunk_size]
+        fetch_wiki_pages(source, chunk)
+        progress.advance(task, len(chunk))
+
+    task = progress.add_task('Wiki attachments', total=len(pagenames))
+    executor = ThreadPoolExecutor(threads)
+    try:
+        for result in executor.map(prefetch_wiki_attachments, pagenames):
+            progress.advance(task)
+    finally:
+        executor.shutdown(cancel_futures=True)
+
+if __name__ == '__main__':
+    from rich.logging import RichHandler
+    logging.basicConfig(level="INFO", format="%(message)s", datefmt="[%X]", handlers=[RichHandler()])
+
+    source = trac_server_proxy()
+    if migrate.attachment_mirror_dir:
+        migrate.attachment_mirror = AttachmentMirror(migrate.attachment_mirror_dir)
+    threads = max(migrate.prefetch_threads, 1)
+
+    with Progress(TextColumn('{task.description}'), BarColumn(), MofNCompleteColumn(),
+                  TimeElapsedColumn(), TextColumn('ETA'), TimeRemainingColumn()) as progress:
+        if migrate.must_convert_issues:
+            if migrate.migrate_milestones:
+                prefetch_milestones(progress, source)
+            prefetch_tickets(progress, source, threads)
+        if migrate.must_convert_wiki:
+            prefetch_wiki(progress, source, threads)
+
+    migrate.output_trac_statistics(sorted(migrate.trac_statistics.items()))
+    migrate.output_cache_statistics(sorted(migrate.cache_statistics.items()))
@@ -0,0 +1,32 @@
+#!/usr/bin/env python3
+# Remove from trac_cache the changelogs, attachments, tickets, milestones and
+# wiki pages changed in Trac since the previous sync, so that the next
+# migration fetches them again instead of the whole cache being removed. A
+# cache filled by an earlier version, which recorded no watermark, is synced
+# since the time SINCE (in ISO format, UTC if no time zone is given), which
+# also syncs a cache again since an earlier time.
+#
+# Usage: python3 sync_trac_cache.py [migrate.cfg]
+#        python3 sync_trac_cache.py migrate.cfg SINCE
+
+import logging
+import sys
+from datetime import datetime, timezone
+
+import migrate
+from migrate import sync_trac_cache, trac_server_proxy
+
+if __name__ == '__main__':
+    from rich.logging import RichHandler
+    logging.basicConfig(level="INFO", format="%(message)s", datefmt="[%X]", handlers=[RichHandler()])
+
+    since = None
+    if len(sys.argv) == 3:
+        since = datetime.fromisoformat(sys.argv[2])
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+    source = trac_server_proxy()
+    synced = sync_trac_cache(source, since)
+    if synced is not None:
+        migrate.log.info('%d tickets and %d wiki pages changed, %d entries removed from the cache' % synced)
+    migrate.output_trac_statistics(sorted(migrate.trac_statistics.items()))
@@ -0,0 +1,27 @@
+import importlib
+import os
+import shutil
+import sys
+
+import pytest
+
+repository = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+@pytest.fixture(scope='session')
+def migrate(tmp_path_factory):
+    """
+    The module migrate, configured by migrate.cfg.example in a temporary
+    directory that holds its caches.
+    """
+    pytest.importorskip('github')
+    directory = tmp_path_factory.mktemp('migration')
+    shutil.copy(os.path.join(repository, 'migrate.cfg.example'), directory / 'migrate.cfg')
+    cwd, argv = os.getcwd(), sys.argv
+    os.chdir(directory)
+    sys.argv = [os.path.join(repository, 'migrate.py'), str(directory / 'migrate.cfg')]
+    sys.path.insert(0, repository)
+    try:
+        yield importlib.import_module('migrate')
+    finally:
+        sys.argv = argv
+        os.chdir(cwd)
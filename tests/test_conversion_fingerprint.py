@@ -0,0 +1,12 @@
+import re
+
+def test_conversion_constants(migrate, monkeypatch):
+    fingerprint = migrate.conversion_fingerprint()
+    assert migrate.conversion_fingerprint() == fingerprint
+
+    # the fetching is not part of the conversion
+    monkeypatch.setattr(migrate, 'retry_attempts', migrate.retry_attempts + 1)
+    assert migrate.conversion_fingerprint() == fingerprint
+
+    monkeypatch.setattr(migrate, 'RE_COLOR', re.compile(migrate.RE_COLOR.pattern, re.I))
+    assert migrate.conversion_fingerprint() != fingerprint
@@ -0,0 +1,22 @@
+import pytest
+
+# tables as trac2markdown writes them for td blocks, with the protection tags
+TABLES = [
+    ['| h | x |', '|:---:|---:|', '|OPENING__PROCESSOR__TDNEW__LINE*a* **b** `c|d`NEW__LINECLOSING__PROCESSOR__TD| y |'],
+    ['|   |   |', '|---|---|', '| a | b |', '|x [[Foo|bar]]`code) *x*`| z |'],
+    ['|   |   |', '|---|---|', '|*x `@`mkoeppe*x*[q](https://x.org/?a=1)*x ``a`b`` \\| c|'],
+    ['| h |', '|---|', '| [#12](https://github.com/sagemath/sage/issues/12) <br> &amp; a_b_c _d_ |'],
+    ['| h |', '|---|', 'no border'],
+    ['| a | b |', '|---|---|'],
+    ['| a | b |', '|:-|-:|', '| ***x** y* | __u__ _v_ |', '| \\*x\\* | ![i](a.png "t") <http://x.org> |'],
+    ['a | b', '--- | ---', 'c | d |'],
+    ['| a | b |', '|---|---|', '| ``x | y ` z |'],
+    ['| a |', '|---|', '| *x*x*q(a)*x and *x*x*q<a>*x |'],
+]
+
+@pytest.mark.parametrize('table', TABLES)
+def test_same_as_python_markdown(migrate, table):
+    markdown = pytest.importorskip('markdown')
+    from markdown.extensions.tables import TableExtension
+    expected = markdown.markdown('\n'.join(table), extensions=[TableExtension(use_align_attribute=True)])
+    assert migrate.markdown_table_html(table) == expected
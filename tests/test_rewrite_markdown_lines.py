@@ -0,0 +1,33 @@
+import pytest
+
+LINES = [
+    'New commits:',
+    '||',
+    '|---|',
+    '|[abc](https://github.com/sagemath/sage/commit/abc)|`first`|',
+    # a row once the report link is rewritten
+    '|[report:1',
+    ']|`report`|',
+    '|[def](https://github.com/sagemath/sage/commit/def)|`second`|',
+    '',
+    'text <span style="color: red">red</span>',
+    '[report:2',
+    '',
+    'title]',
+    '',
+    'Last 1 new commits:',
+    '||',
+    '|---|',
+    '|[ghi](https://github.com/sagemath/sage/commit/ghi)|`third`|',
+    '',
+    '',
+    'end',
+]
+
+@pytest.mark.parametrize('chunk_lines', [1, 2])
+def test_streamed_as_joined(migrate, monkeypatch, chunk_lines):
+    joined = migrate.rewrite_markdown(migrate.remove_artifacts('\n'.join(LINES)))
+    monkeypatch.setattr(migrate, 'rewrite_chunk_lines', chunk_lines)
+    chunks = list(migrate.rewrite_markdown_lines(LINES))
+    assert len(chunks) > 1
+    assert '\n'.join(chunks) == joined
@@ -0,0 +1,38 @@
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+def trac(changed_tickets):
+    """
+    Source of the Trac whose tickets changed recently are ``changed_tickets``.
+    """
+    return SimpleNamespace(
+        ticket=SimpleNamespace(getRecentChanges=lambda since: changed_tickets,
+                               query=lambda filter_issues: [1, 2]),
+        wiki=SimpleNamespace(getRecentChanges=lambda since: [], getAllPages=lambda: []))
+
+def test_new_cache_has_watermark(migrate):
+    assert isinstance(migrate.cache.get('sync_watermark'), datetime)
+
+def test_old_cache_without_watermark(migrate):
+    source = trac([1])
+    migrate.cache.clear()
+    # a cache filled by an earlier version, which recorded no watermark
+    migrate.cache.set(migrate.get_changeLog.__cache_key__(source, 1), [])
+    migrate.cache.set(migrate.get_changeLog.__cache_key__(source, 2), [])
+    migrate.cache.set(migrate.get_ticket_ids.__cache_key__(source, migrate.filter_issues), [1, 2])
+
+    # the fetches do not make it look fresh
+    assert migrate.get_ticket_ids(source, migrate.filter_issues) == [1, 2]
+    assert migrate.sync_trac_cache(source) is None
+    assert 'sync_watermark' not in migrate.cache
+    assert migrate.get_changeLog.__cache_key__(source, 1) in migrate.cache
+
+    since = datetime(2020, 1, 1, tzinfo=timezone.utc)
+    changed_tickets, changed_pages, removed = migrate.sync_trac_cache(source, since)
+    assert (changed_tickets, changed_pages) == (1, 0)
+    assert migrate.get_changeLog.__cache_key__(source, 1) not in migrate.cache
+    assert migrate.get_changeLog.__cache_key__(source, 2) in migrate.cache
+    assert migrate.cache.get('sync_watermark') > since
+
+    # then it is synced since the recorded watermark
+    assert migrate.sync_trac_cache(trac([])) == (0, 0, 0)